@@ -0,0 +1,95 @@
+"""Length-prefixed framing for the TicTacToeMessage stream.
+
+TCP and TLS do not preserve message boundaries, so every message on the wire
+is written as a varint holding the payload length followed by the serialized
+TicTacToeMessage. MessageDecoder buffers whatever a read returns and hands
+back every complete message, however the bytes were split or coalesced.
+"""
+from tictactoe_pb2 import TicTacToeMessage
+
+MAX_FRAME_SIZE = 64 * 1024
+MAX_VARINT_BYTES = 10
+
+
+class FrameError(ValueError):
+    """Raised when the peer sends a length prefix that cannot be honoured."""
+
+
+def encode_varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_frame(payload):
+    """Prefix an already serialized message with its length."""
+    return encode_varint(len(payload)) + payload
+
+
+def encode_message(msg):
+    return encode_frame(msg.SerializeToString())
+
+
+class MessageDecoder:
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+
+    def _next_frame(self, pos):
+        """Return (start, end) of the frame at pos, or None if it is incomplete."""
+        length = 0
+        shift = 0
+        end = len(self.buffer)
+        while True:
+            if pos >= end:
+                return None
+            byte = self.buffer[pos]
+            pos += 1
+            length |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                break
+            shift += 7
+            if shift >= 7 * MAX_VARINT_BYTES:
+                raise FrameError("Malformed length prefix")
+        if length > self.max_frame_size:
+            raise FrameError(f"Frame of {length} bytes exceeds the {self.max_frame_size} byte limit")
+        if pos + length > end:
+            return None
+        return pos, pos + length
+
+    def next_message(self):
+        """Pop the next complete message from the buffer, or return None."""
+        frame = self._next_frame(0)
+        if frame is None:
+            return None
+        start, end = frame
+        msg = TicTacToeMessage()
+        msg.ParseFromString(bytes(self.buffer[start:end]))
+        del self.buffer[:end]
+        return msg
+
+    def messages(self):
+        """Pop every complete message from the buffer in arrival order."""
+        messages = []
+        pos = 0
+        view = memoryview(self.buffer)
+        try:
+            while True:
+                frame = self._next_frame(pos)
+                if frame is None:
+                    break
+                start, pos = frame
+                msg = TicTacToeMessage()
+                msg.ParseFromString(view[start:pos])
+                messages.append(msg)
+        finally:
+            view.release()
+        if pos:
+            del self.buffer[:pos]
+        return messages
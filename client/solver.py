@@ -0,0 +1,145 @@
+"""Perfect-play tic-tac-toe engine backed by a precomputed move table.
+
+Every position is solved once by negamax with a transposition table and the
+result is saved to moves.bin, which ships with the client. Picking a move is
+then a single table lookup instead of a search.
+
+A position is seen from the side to move as (mover's mask, opponent's mask).
+Its table slot is the base-3 number whose digit i is 0 when square i is empty,
+1 for the mover and 2 for the opponent, giving 3**9 slots. Each slot holds a
+16-bit entry:
+
+    bits 0-8   squares that play optimally
+    bits 9-10  outcome with best play: LOSS, DRAW or WIN for the mover
+               (0 marks positions that cannot occur)
+
+Run this file to regenerate moves.bin.
+"""
+import os
+import random
+import sys
+from array import array
+from bitboard import WIN_LINE, FULL_BOARD
+from symmetry import PERMUTE, canonical
+
+TABLE_FILE = "moves.bin"
+TABLE_SIZE = 3 ** 9
+
+LOSS, DRAW, WIN = 1, 2, 3
+OUTCOME_SHIFT = 9
+
+# Chance of playing an optimal move rather than a random one.
+DIFFICULTIES = {
+    "Easy": 0.0,
+    "Medium": 0.5,
+    "Hard": 0.85,
+    "Impossible": 1.0,
+}
+
+# TERNARY[mask] is the base-3 number with a 1 digit for every bit set in mask.
+TERNARY = tuple(sum(3 ** square for square in range(9) if mask >> square & 1)
+                for mask in range(512))
+
+
+def position_index(mover, opponent):
+    return TERNARY[mover] + 2 * TERNARY[opponent]
+
+
+def negamax(mover, opponent, cache):
+    """Score a position for the side to move and record its optimal moves.
+
+    Only the canonical image of each position is searched and cached, with its
+    optimal moves in that image's orientation; build_table maps them back.
+    Quicker wins score higher and slower losses score less badly, so the engine
+    finishes a won game instead of wandering.
+    """
+    mover, opponent, _ = canonical(mover, opponent)
+    key = mover << 9 | opponent
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0]
+
+    occupied = mover | opponent
+    empty = 9 - bin(occupied).count("1")
+    if WIN_LINE[opponent]:
+        score = -(empty + 1)
+        best_moves = 0
+    elif occupied == FULL_BOARD:
+        score = 0
+        best_moves = 0
+    else:
+        score = None
+        best_moves = 0
+        for square in range(9):
+            bit = 1 << square
+            if occupied & bit:
+                continue
+            move_score = -negamax(opponent, mover | bit, cache)
+            if score is None or move_score > score:
+                score, best_moves = move_score, bit
+            elif move_score == score:
+                best_moves |= bit
+    cache[key] = (score, best_moves)
+    return score
+
+
+def build_table(cache=None):
+    """Solve the game and expand every canonical result to all of its images."""
+    if cache is None:
+        cache = {}
+    negamax(0, 0, cache)
+    table = array("H", bytes(2 * TABLE_SIZE))
+    for key, (score, best_moves) in cache.items():
+        outcome = WIN if score > 0 else LOSS if score < 0 else DRAW
+        mover, opponent = key >> 9, key & 0x1FF
+        for permute in PERMUTE:
+            index = position_index(permute[mover], permute[opponent])
+            table[index] = outcome << OUTCOME_SHIFT | permute[best_moves]
+    return table
+
+
+class MoveTable:
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def load(cls, path):
+        table = array("H")
+        with open(path, "rb") as f:
+            table.frombytes(f.read())
+        if sys.byteorder == "big":
+            table.byteswap()
+        if len(table) != TABLE_SIZE:
+            raise ValueError(f"{path} holds {len(table)} entries, expected {TABLE_SIZE}")
+        return cls(table)
+
+    def save(self, path):
+        table = array("H", self.table)
+        if sys.byteorder == "big":
+            table.byteswap()
+        with open(path, "wb") as f:
+            f.write(table.tobytes())
+
+    def optimal_moves(self, mover, opponent):
+        entry = self.table[position_index(mover, opponent)]
+        return [square for square in range(9) if entry >> square & 1]
+
+    def outcome(self, mover, opponent):
+        return self.table[position_index(mover, opponent)] >> OUTCOME_SHIFT
+
+    def choose_move(self, board, shape, skill=1.0):
+        """Pick a square for shape: optimal with probability skill, otherwise random."""
+        mover, opponent = board.masks_for(shape)
+        if random.random() < skill:
+            moves = self.optimal_moves(mover, opponent)
+        else:
+            moves = board.free_squares()
+        return random.choice(moves) if moves else None
+
+
+if __name__ == "__main__":
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), TABLE_FILE)
+    cache = {}
+    MoveTable(build_table(cache)).save(path)
+    print(f"Solved {len(cache)} canonical positions, wrote {path}")
+
@@ -0,0 +1,61 @@
+"""Rotations and reflections of the board.
+
+A square has 8 images under the symmetries of the square (4 rotations, each
+optionally mirrored), and a position and its images have the same value and
+the same best moves once those are mapped across. canonical() picks one
+representative per family through precomputed permutation tables, so the
+solver's search only ever deals with roughly an eighth of the positions.
+
+Positions are the (mover, opponent) mask pairs used by bitboard and solver.
+"""
+
+
+def _symmetry(transform):
+    """Square permutation for a transform of (row, column) coordinates."""
+    return tuple(3 * row + column
+                 for row, column in (transform(square // 3, square % 3) for square in range(9)))
+
+
+# SYMMETRIES[k][square] is where symmetry k moves square.
+SYMMETRIES = (
+    _symmetry(lambda r, c: (r, c)),          # identity
+    _symmetry(lambda r, c: (c, 2 - r)),      # rotate 90 clockwise
+    _symmetry(lambda r, c: (2 - r, 2 - c)),  # rotate 180
+    _symmetry(lambda r, c: (2 - c, r)),      # rotate 270 clockwise
+    _symmetry(lambda r, c: (r, 2 - c)),      # mirror left-right
+    _symmetry(lambda r, c: (2 - r, c)),      # mirror top-bottom
+    _symmetry(lambda r, c: (c, r)),          # main diagonal
+    _symmetry(lambda r, c: (2 - c, 2 - r)),  # anti-diagonal
+)
+
+# INVERSE[k] is the symmetry that undoes symmetry k.
+INVERSE = tuple(SYMMETRIES.index(tuple(permutation.index(square) for square in range(9)))
+                for permutation in SYMMETRIES)
+
+# PERMUTE[k][mask] is mask with every square moved by symmetry k.
+PERMUTE = tuple(
+    tuple(sum(1 << permutation[square] for square in range(9) if mask >> square & 1)
+          for mask in range(512))
+    for permutation in SYMMETRIES
+)
+
+
+def canonical(mover, opponent):
+    """Return (mover, opponent, k): the family representative and the symmetry k giving it.
+
+    The representative is the image with the smallest mover << 9 | opponent key.
+    Map results for it back to the original position with PERMUTE[INVERSE[k]].
+    """
+    best = None
+    for k, permute in enumerate(PERMUTE):
+        key = permute[mover] << 9 | permute[opponent]
+        if best is None or key < best[0]:
+            best = (key, k)
+    key, k = best
+    return key >> 9, key & 0x1FF, k
+
+
+def canonical_key(mover, opponent):
+    """A single int identifying the position's family."""
+    mover, opponent, _ = canonical(mover, opponent)
+    return mover << 9 | opponent
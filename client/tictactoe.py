@@ -10,11 +10,55 @@ import ssl
 import os
 import sys
 import threading
+import time
+import uuid
 from tictactoe_pb2 import TicTacToeMessage, MessageType, PlayerType, PlayerShape
+from framing import MessageDecoder, encode_message
+import bitboard
+from bitboard import Board
+from solver import MoveTable, DIFFICULTIES, TABLE_FILE
 
 base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
 os_type = platform.system()
+REJOIN_WINDOW = 30  # seconds; the server holds a dropped player's game this long by default
+MAX_CHAT_LENGTH = 200  # the server drops longer chat messages
 logging.basicConfig(level=logging.CRITICAL, format="%(asctime)s:%(levelname)s:%(message)s")
+SHAPES = {"X": bitboard.X, "O": bitboard.O}
+PLAYER_ID_FILE = "player_id"
+
+
+def config_dir():
+    """Per-user directory for the client's settings."""
+    if os_type == "Windows":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    elif os_type == "Darwin":
+        base = os.path.expanduser("~/Library/Application Support")
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(base, "TicTacToeOnline")
+
+
+def load_player_id():
+    """The id the server rates this player's games under, created on first launch.
+
+    It is saved so that the rating follows the player from one launch to the next.
+    """
+    path = os.path.join(config_dir(), PLAYER_ID_FILE)
+    try:
+        with open(path) as id_file:
+            player_id = id_file.read().strip()
+        if player_id:
+            return player_id
+    except OSError:
+        pass
+    player_id = uuid.uuid4().hex
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as id_file:
+            id_file.write(player_id)
+    except OSError as e:
+        logging.error(f"Could not save the player id: {e}")
+    return player_id
 
 
 class App(tk.Tk):
@@ -66,10 +110,16 @@ class Menu(tk.Frame):
             "highlightthickness": 0
         }
 
-        cpu_button = tk.Button(self, text="Play a CPU", padx=10, pady=5,
-                               command=lambda: self.select("CPU", Game), **button_style)
+        cpu_button = tk.Button(self, text="Play a CPU", padx=10, pady=5, **button_style)
         cpu_button.place(x=25, y=225)
 
+        self.difficulty_menu = tk.Menu(self, tearoff=0, font=("Helvetica", 12))
+        for difficulty in DIFFICULTIES:
+            self.difficulty_menu.add_command(
+                label=difficulty, command=lambda d=difficulty: self.select("CPU", Game, d))
+        cpu_button.config(command=lambda: self.difficulty_menu.post(
+            cpu_button.winfo_rootx(), cpu_button.winfo_rooty() + cpu_button.winfo_height()))
+
         friend_button = tk.Button(self, text="Local Play", padx=10, pady=5,
                                   command=lambda: self.select("LAN", Game), **button_style)
         friend_button.place(x=195, y=225)
@@ -79,9 +129,11 @@ class Menu(tk.Frame):
         online_button.place(x=365, y=225)
 
     @staticmethod
-    def select(mode, frame):
+    def select(mode, frame, difficulty=None):
         game = app.show_frame(frame)
         game.mode = mode
+        if difficulty is not None:
+            game.difficulty = difficulty
         logging.info(f"Game mode selected: {mode}")
         game.start()
 
@@ -94,21 +146,29 @@ class Game(tk.Frame):
         self.setup_chat_ui()
         self.layout_chat_ui()
         self.setup_sounds()
+        self.move_table = MoveTable.load(os.path.join(base_path, TABLE_FILE))
+        # Kept for the whole run so reconnects can resume the last TLS session.
+        self.ssl_context = self.create_ssl_context()
+        self.tls_session = None
 
     def setup_variables(self):
-        self.version = "1.0.0"
+        self.version = "1.1.0"
+        self.player_id = load_player_id()  # lets the server rate this player's games
         self.waiting_music_started = False
         self.cpu_turn = False
         self.mode = None
         self.client_socket = None
+        self.rejoin_details = None
+        self.rejoining = False
         self.animate_event = None
         self.game_over = False
         self.circle = None
         self.foreground = []
         self.player = None
-        self.board = [None] * 9
+        self.board = Board()
         self.shape = None
         self.cpu_shape = None
+        self.difficulty = "Impossible"
     
     def setup_sounds(self):
         sound_path_chat = os.path.join(base_path, "sounds", "chat.wav")
@@ -245,17 +305,31 @@ class Game(tk.Frame):
             click_box = self.canvas.create_rectangle(*self.coordinates, fill="black")
             self.canvas.tag_bind(click_box, "<Button-1>", lambda event, j=i: self.clicked(event, j))
 
-    def start_client(self):
-        """Start the client and try to connect to the server."""
+    @staticmethod
+    def create_ssl_context():
         context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.set_ciphers("ECDHE+AESGCM")
+        return context
+
+    def open_connection(self, version_message):
+        """Connect to the server and send version_message; socket errors are left to the caller."""
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.client_socket = context.wrap_socket(self.client_socket, 
-                                                 server_hostname="tictactoe.revogg.com")
-        try:
-            self.client_socket.connect(("tictactoe.revogg.com", 52423))
+        self.client_socket = self.ssl_context.wrap_socket(self.client_socket, 
+                                                          server_hostname="tictactoe.revogg.com",
+                                                          session=self.tls_session)
+        self.client_socket.connect(("tictactoe.revogg.com", 52423))
+        logging.info(f"TLS session resumed: {self.client_socket.session_reused}")
+        self.client_socket.sendall(encode_message(version_message))
 
-            version_message = TicTacToeMessage(type=MessageType.VERSION_CHECK, version=self.version)
-            self.client_socket.send(version_message.SerializeToString())
+    def start_client(self):
+        """Start the client and try to connect to the server."""
+        self.rejoin_details = None
+        self.rejoining = False
+        try:
+            version_message = TicTacToeMessage(type=MessageType.VERSION_CHECK, version=self.version,
+                                               player_id=self.player_id)
+            self.open_connection(version_message)
 
             threading.Thread(target=self.listen_for_moves, daemon=True).start()
         except (ConnectionRefusedError, ConnectionResetError, ssl.SSLError) as e:
@@ -271,36 +345,64 @@ class Game(tk.Frame):
 
     def listen_for_moves(self):
         """Listen for moves/messages from the server."""
+        decoder = MessageDecoder()
         while True:
             try:
-                data = self.client_socket.recv(1024)
+                data = self.client_socket.recv(4096)
                 if not data:
                     logging.info("Connection closed by server.")
                     break
 
-                msg = TicTacToeMessage()
-                msg.ParseFromString(data)
-                self.handle_received_message(msg)
+                decoder.feed(data)
+                for msg in decoder.messages():
+                    self.handle_received_message(msg)
 
             except socket.error as e:
                 logging.error(f"Socket error in listen_for_moves: {e}")
+                if self.rejoin_details is not None and self.rejoin():
+                    decoder = MessageDecoder()
+                    continue
                 break
             except Exception as e:
                 logging.error(f"Unexpected error in listen_for_moves: {e}")
                 break
 
+    def rejoin(self):
+        """Reconnect after the connection dropped mid-game and ask for the same game back."""
+        session_id, player, resume_token = self.rejoin_details
+        self.display_message("Server: Connection lost, reconnecting...")
+        if self.client_socket is not None:
+            self.client_socket.close()
+        rejoin_message = TicTacToeMessage(type=MessageType.VERSION_CHECK, version=self.version,
+                                          content=session_id, player=player,
+                                          resume_token=resume_token, player_id=self.player_id)
+        deadline = time.monotonic() + REJOIN_WINDOW
+        delay = 0.5
+        while time.monotonic() < deadline and self.rejoin_details is not None:
+            time.sleep(delay)
+            try:
+                self.rejoining = True
+                self.open_connection(rejoin_message)
+                return True
+            except (OSError, ssl.SSLError) as e:
+                logging.error(f"Failed to reconnect: {e}")
+                delay = min(delay * 2, 4)
+        self.rejoining = False
+        self.display_message("Server: Could not reconnect to the game")
+        return False
+
         # ============== Chat related methods ==============
 
     def send_message(self):
         """Send a chat message to the server."""
-        message = self.message_entry.get().strip()
+        message = self.message_entry.get().strip()[:MAX_CHAT_LENGTH]
         if message:
             try:
                 self.display_message(f"You: {message}")
                 self.message_entry.delete(0, tk.END)
                 if self.mode == "IP" and not self.waiting_music_started:
                     chat_message = TicTacToeMessage(type=MessageType.CHAT, content=message)
-                    self.client_socket.send(chat_message.SerializeToString())
+                    self.client_socket.sendall(encode_message(chat_message))
             except ssl.SSLEOFError:
                 logging.error("A disconnection has occured; cannot send message")
             except Exception as e:
@@ -396,14 +498,14 @@ class Game(tk.Frame):
         if self.game_over:
             return
 
-        available_moves = [index for index, value in enumerate(self.board) if value is None]
-        if available_moves:
-            move = random.choice(available_moves)
+        skill = DIFFICULTIES[self.difficulty]
+        move = self.move_table.choose_move(self.board, SHAPES[self.cpu_shape], skill)
+        if move is not None:
             self.process_move(move, self.cpu_shape)
 
     def process_move(self, i, shape):
         """Handle a move, both from the player and the CPU."""
-        valid_move = not (self.game_over or self.board[i] is not None or self.cpu_turn)
+        valid_move = not (self.game_over or not self.board.is_free(i) or self.cpu_turn)
         if not valid_move:
             return
 
@@ -416,7 +518,7 @@ class Game(tk.Frame):
 
     def draw_symbol_on_board(self, i, shape):
         """Draw the symbol (X or O) on the board."""
-        if self.board[i]:
+        if not self.board.is_free(i):
             return
         
         self.move_sound.play()
@@ -426,12 +528,11 @@ class Game(tk.Frame):
         symbol_location[2] -= 15
         symbol_location[3] -= 15
 
+        self.board.place(i, SHAPES[shape])
         if shape == "O":
-            self.board[i] = "O"
             oval = self.canvas.create_oval(*symbol_location, outline="Red", width=12)
             self.foreground.append(oval)
         elif shape == "X":
-            self.board[i] = "X"
             line1 = self.canvas.create_line(*symbol_location, fill="Blue", width=12)
             self.foreground.append(line1)
             symbol_location[0] += 60
@@ -441,7 +542,7 @@ class Game(tk.Frame):
 
     def process_lan_move(self, i):
         """Handle a move in LAN mode and toggle the player."""
-        valid_move = not (self.game_over or self.board[i] is not None or self.cpu_turn)
+        valid_move = not (self.game_over or not self.board.is_free(i) or self.cpu_turn)
         if not valid_move:
             return
 
@@ -464,7 +565,8 @@ class Game(tk.Frame):
             MessageType.CHAT: self.handle_chat,
             MessageType.MESSAGE: self.handle_server_message,
             MessageType.PLAY_AGAIN: self.handle_play_again,
-            MessageType.VERSION_CHECK: self.handle_version_check
+            MessageType.VERSION_CHECK: self.handle_version_check,
+            MessageType.SNAPSHOT: self.handle_snapshot,
         }
         handler = handlers.get(msg.type)
         if handler:
@@ -475,6 +577,7 @@ class Game(tk.Frame):
     def handle_start(self, msg):
         """Handle start message."""
         self.player = PlayerType.Name(msg.player)
+        self.rejoin_details = (msg.content, msg.player, msg.resume_token)
         logging.info(f"Joined session {msg.content} as {self.player}")
         self.matchfound_sound.play()
         self.stop_waiting_music()
@@ -514,7 +617,31 @@ class Game(tk.Frame):
             self.update_turn_indicator(self.shape, color="inactive")
 
         self.game_over = False
-        self.board = [None] * 9
+        self.board = Board()
+
+    def handle_snapshot(self, msg):
+        """Restore the game the server held for us while we were reconnecting."""
+        self.rejoining = False
+        self.shape = "X" if msg.player_shape == PlayerShape.X else "O"
+        self.cpu_shape = "O" if self.shape == "X" else "X"
+        self._clear_foreground_widgets()
+        self.board = Board()
+        for i, square in enumerate(msg.content):
+            if square in SHAPES:
+                self.canvas.after(0, self.draw_symbol_on_board, i, square)
+
+        if msg.is_your_turn:
+            self.update_turn_indicator(self.shape)
+        else:
+            self.update_turn_indicator(self.shape, color="inactive")
+
+        self.game_over = bool(msg.win_type)
+        if msg.win_type and msg.win_type != bitboard.DRAW:
+            self.canvas.after(100, lambda: self.win_check(server_win=msg.win_type - 1))
+        self.display_message("Server: Reconnected to your game")
+        if self.game_over:
+            self._remove_play_again_ui()
+            self.prompt_play_again()
 
     def handle_chat(self, msg):
         """Handle chat message."""
@@ -523,11 +650,22 @@ class Game(tk.Frame):
     def handle_server_message(self, msg):
         """Display server messages."""
         self.display_message("Server: " + msg.content)
+        if self.rejoining:
+            # Our game ended while we were away; the server has queued us for a new one.
+            self.rejoining = False
+            self.rejoin_details = None
+            self._remove_play_again_ui()
+            self._clear_foreground_widgets()
+            self.game_over = False
+            self.board = Board()
+            self.update_turn_indicator("C")
     
     def handle_play_again(self, msg):
         self.update_turn_indicator(self.shape, color="yellow")
     
     def handle_version_check(self, msg):
+        if msg.content == "VALID" and self.rejoining:
+            return
         if msg.content == "VALID":
             self.update_turn_indicator("C")
             self.display_message("Server: Searching for a match...")
@@ -543,7 +681,7 @@ class Game(tk.Frame):
         if self.mode == "IP" and not self.waiting_music_started:
             try:
                 move_message = TicTacToeMessage(type=MessageType.MOVE, content=str(i))
-                self.client_socket.send(move_message.SerializeToString())
+                self.client_socket.sendall(encode_message(move_message))
             except (BrokenPipeError, ssl.SSLEOFError):
                 logging.error("Failed to send move: not connected to the server.")
                 #self.display_message("Opponent has disconnected.")
@@ -577,12 +715,12 @@ class Game(tk.Frame):
         self.update_turn_indicator(None)
 
         self.game_over = False
-        self.board = [None] * 9
+        self.board = Board()
         self.cpu_turn = False
 
         if self.mode == "IP" and not menu:
             reset_message = TicTacToeMessage(type=MessageType.RESET_REQUEST)
-            self.client_socket.send(reset_message.SerializeToString())
+            self.client_socket.sendall(encode_message(reset_message))
 
     def _remove_play_again_ui(self):
         """Remove the UI elements related to playing again."""
@@ -592,8 +730,18 @@ class Game(tk.Frame):
             self.yes_button.destroy()
 
     def disconnect(self):
+        self.rejoin_details = None
         try:
             if self.client_socket:
+                # Tell the server we are quitting on purpose so it does not hold the game.
+                try:
+                    leave_message = TicTacToeMessage(type=MessageType.LEAVE)
+                    self.client_socket.sendall(encode_message(leave_message))
+                except OSError:
+                    pass
+                # TLS 1.3 tickets arrive after the handshake, so save the session on the way out.
+                if self.client_socket.session is not None:
+                    self.tls_session = self.client_socket.session
                 self.client_socket.shutdown(socket.SHUT_RDWR)
                 self.client_socket.close()
                 self.client_socket = None
@@ -614,17 +762,6 @@ class Game(tk.Frame):
 
     def win_check(self, server_win=None):
         """Check if there is a winning condition."""
-        win_conditions = [
-            [0, 1, 2],
-            [3, 4, 5],
-            [6, 7, 8],  # horizontal
-            [0, 3, 6],
-            [1, 4, 7],
-            [2, 5, 8],  # vertical
-            [0, 4, 8],
-            [2, 4, 6],  # diagonal
-        ]
-
         lines = [
             [(120, 100, 420, 100)],
             [(120, 200, 420, 200)],
@@ -640,27 +777,20 @@ class Game(tk.Frame):
             self.draw_win_line(server_win, lines)
             return
 
-        for i, condition in enumerate(win_conditions):
-            if self.check_win_condition_met(condition):
-                self.draw_win_line(i, lines)
-                self.game_over = True
-                self.prompt_play_again()
-
-                if self.mode == "CPU":
-                    if self.board[condition[0]] == self.shape:
-                        self.win_sound.play()
-                    else:
-                        self.lose_sound.play()
-                return
+        status = self.board.status()
+        if status == 0:
+            return
 
-        if None not in self.board:
-            self.game_over = True
-            self.prompt_play_again()
+        if status != bitboard.DRAW:
+            self.draw_win_line(status - 1, lines)
+        self.game_over = True
+        self.prompt_play_again()
 
-    def check_win_condition_met(self, condition):
-        """Check if the provided win condition is met."""
-        return all(self.board[condition[0]] and 
-                   self.board[i] == self.board[condition[0]] for i in condition)
+        if self.mode == "CPU" and status != bitboard.DRAW:
+            if self.board.winner() == SHAPES[self.shape]:
+                self.win_sound.play()
+            else:
+                self.lose_sound.play()
 
     def draw_win_line(self, win_index, lines):
         """Draw the winning line on the board."""
@@ -0,0 +1,146 @@
+"""Batch statistics over the game log written with --record-dir.
+
+The log files are opened with game_log.GameLog, and the records it maps are
+viewed in place as NumPy structured arrays. Every statistic is then a handful
+of whole-array operations, with no Python loop over games, so millions of
+games take seconds on one core:
+
+    python analytics.py records/
+
+It reports, per board variant, the results by first mover and by shape,
+opening move frequencies, average game length, and the rematch rate: the
+share of games followed by another game in the same session, which only
+happens after a RESET_REQUEST from both players.
+
+NumPy is only needed here, not by the server: pip install numpy
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+try:
+    import numpy as np
+except ImportError:
+    sys.exit("analytics.py needs NumPy: pip install numpy")
+from bitboard import DRAW as CLASSIC_DRAW, X
+import game_log
+import mnk
+
+
+def record_dtype(variant):
+    """NumPy dtype of one record of a variant's log file (see game_log.RECORD_HEADER)."""
+    rows, columns, _ = variant
+    square_type = "u1" if game_log.move_format(variant) == "B" else "<u2"
+    dtype = np.dtype([
+        ("sid", "S8"), ("player1_shape", "u1"), ("first_mover", "u1"), ("result", "<i2"),
+        ("moves", "<u2"), ("ended_at", "<u4"), ("padding", "V2"),
+        ("squares", square_type, (rows * columns,)),
+    ])
+    assert dtype.itemsize == game_log.record_size(variant)
+    return dtype
+
+
+def load(paths):
+    """Map every log file and join them into one record array per variant."""
+    parts = {}
+    for path in paths:
+        try:
+            log = game_log.GameLog(path)
+        except (OSError, ValueError) as e:
+            print(e, file=sys.stderr)
+            continue
+        # The arrays keep the map alive after the log is closed.
+        with log:
+            if len(log):
+                parts.setdefault(log.variant, []).append(
+                    np.frombuffer(log.records, dtype=record_dtype(log.variant)))
+    return {variant: arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+            for variant, arrays in parts.items()}
+
+
+def summarize(records, variant):
+    rows, columns, _ = variant
+    moves = records["moves"].astype(np.int64)
+    first_mover = records["first_mover"].astype(np.int64)
+    result = records["result"]
+    draw = CLASSIC_DRAW if variant == mnk.CLASSIC else mnk.DRAW
+
+    finished = result != 0
+    drawn = result == draw
+    won = finished & ~drawn
+    # Players alternate, so the first mover played the last move when the count is odd.
+    first_mover_won = won & (moves % 2 == 1)
+    winner = np.where(moves % 2 == 1, first_mover, 3 - first_mover)
+    player1_shape = records["player1_shape"].astype(np.int64)
+    winner_shape = np.where(winner == 1, player1_shape, 3 - player1_shape)  # X=1, O=2
+    x_won = won & (winner_shape == X)
+
+    played = moves > 0
+    openings = np.bincount(records["squares"][played, 0].astype(np.int64),
+                           minlength=rows * columns)
+
+    # The 8-byte sids sort much faster as integers. Games of a session end up next to each
+    # other, and a game with another of its session after it was rematched.
+    sids = np.sort(np.ascontiguousarray(records["sid"]).view("<u8"))
+    same_session = sids[1:] == sids[:-1]
+    rematched = int(np.count_nonzero(same_session))
+
+    return {
+        "games": len(records),
+        "finished": int(finished.sum()),
+        "abandoned": int((~finished).sum()),
+        "first_mover_wins": int(first_mover_won.sum()),
+        "second_mover_wins": int((won & ~first_mover_won).sum()),
+        "x_wins": int(x_won.sum()),
+        "o_wins": int((won & ~x_won).sum()),
+        "draws": int(drawn.sum()),
+        "average_moves": float(moves[finished].mean()) if finished.any() else 0.0,
+        "openings": openings,
+        "sessions": len(records) - rematched,
+        "rematched": rematched,
+    }
+
+
+def share(count, total):
+    return f"{count} ({count / total:.1%})" if total else "0"
+
+
+def report(summary, variant):
+    rows, columns, k = variant
+    finished = summary["finished"]
+    print(f"Board {rows}x{columns}, {k} in a row")
+    print(f"Games:          {summary['games']} in {summary['sessions']} sessions, "
+          f"{summary['abandoned']} abandoned")
+    print(f"First mover:    wins {share(summary['first_mover_wins'], finished)}, "
+          f"loses {share(summary['second_mover_wins'], finished)}, "
+          f"draws {share(summary['draws'], finished)}")
+    print(f"By shape:       X wins {share(summary['x_wins'], finished)}, "
+          f"O wins {share(summary['o_wins'], finished)}")
+    print(f"Average length: {summary['average_moves']:.2f} moves per finished game")
+    print(f"Rematch rate:   {share(summary['rematched'], summary['games'])} of games "
+          f"were followed by another in the same session")
+    openings = summary["openings"]
+    total = openings.sum()
+    print("Openings:       " + ", ".join(
+        f"{square}: {openings[square] / total:.1%}"
+        for square in np.argsort(openings)[::-1][:9] if openings[square]))
+    print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Statistics over Tic-Tac-Toe Online game logs")
+    parser.add_argument("paths", nargs="+",
+                        help="game log files, or directories of them, written with --record-dir")
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, "games-*.bin"))))
+        else:
+            paths.append(path)
+    started_at = time.perf_counter()
+    for variant, records in sorted(load(paths).items()):
+        report(summarize(records, variant), variant)
+    print(f"Analyzed in {time.perf_counter() - started_at:.2f} s")
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import socket
+from tictactoe_pb2 import MessageType
+from server import TicTacToeServer, RECV_SIZE
+from framing import MessageDecoder
+import mnk
+from metrics import METRICS
+from sessions import SWEEP_INTERVAL
+from spectators import StreamWatcher
+from multiplex import BoardChannel
+
+MAX_WRITE_BUFFER = 64 * 1024
+
+
+class StreamConnection:
+    """Socket-like wrapper around an asyncio stream pair.
+
+    TicTacToeGame only ever calls send/shutdown/close on a connection, so the
+    game logic runs unchanged on top of the event loop.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.paired = asyncio.get_running_loop().create_future()
+        self.decoder = MessageDecoder()
+        self.variant = mnk.CLASSIC  # the board asked for in the version check
+        self.player_id = ""  # sent with the version check by clients that want ratings
+
+    def send(self, data):
+        if self.writer.is_closing():
+            raise BrokenPipeError("Connection is already closed")
+        if self.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            self.writer.transport.abort()
+            raise ConnectionResetError("Client is not reading its messages")
+        self.writer.write(data)
+        return len(data)
+
+    async def _fill(self):
+        data = await self.reader.read(RECV_SIZE)
+        METRICS.bytes_received.inc(len(data))
+        self.decoder.feed(data)
+        return bool(data)
+
+    async def read_message(self):
+        """Wait for the next message; None means the peer closed the connection."""
+        while True:
+            msg = self.decoder.next_message()
+            if msg is not None or not await self._fill():
+                return msg
+
+    async def read_messages(self):
+        """Wait for at least one complete message and return all buffered ones.
+
+        An empty list means the peer closed the connection.
+        """
+        while True:
+            messages = self.decoder.messages()
+            if messages or not await self._fill():
+                return messages
+
+    def shutdown(self, how):
+        self.close()
+
+    def close(self):
+        if not self.writer.is_closing():
+            self.writer.close()
+
+
+class AsyncTicTacToeServer(TicTacToeServer):
+    def __init__(self, max_games=50000, **options):
+        super().__init__(max_games, **options)
+        self.loop = None
+        self.game_slots.on_release(self.match_players)
+
+    def call_soon(self, callback, *args):
+        """Run callback on the event loop, which owns player_queue."""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def call_later(self, delay, callback, *args):
+        """Run callback after delay seconds on the event loop."""
+        return self.loop.call_later(delay, callback, *args)
+
+    def start(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        logging.info("Starting Server...", extra={'sid': 'server'})
+        self.loop = asyncio.get_running_loop()
+        self.call_later(SWEEP_INTERVAL, self.sweep_sessions)
+        self.widen_rating_windows()
+        self.start_metrics()
+        self.start_recorder()
+        context = self.create_ssl_context()
+        server = await asyncio.start_server(self.handle_connection, "0.0.0.0", 52423,
+                                            ssl=context, backlog=1024,
+                                            reuse_port=self.reuse_port or None,
+                                            ssl_handshake_timeout=self.handshake_timeout)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        conn = StreamConnection(reader, writer)
+        ssl_object = writer.get_extra_info("ssl_object")
+        self.handshake_stats.record_completion(ssl_object.session_reused)
+        try:
+            msg = await asyncio.wait_for(conn.read_message(), self.version_check_timeout)
+            if msg is None:
+                raise ConnectionError("Client disconnected before the version check")
+            if not self.answer_version_check(conn, msg):
+                conn.close()
+                return
+        except asyncio.TimeoutError:
+            METRICS.rejected.inc(label_value="version_check")
+            logging.error("Failed to perform version check: timed out", extra={'sid': 'server'})
+            conn.close()
+            return
+        except Exception as e:
+            METRICS.rejected.inc(label_value="version_check")
+            logging.error(f"Failed to perform version check: {e}", extra={'sid': 'server'})
+            conn.close()
+            return
+
+        if msg.type == MessageType.SPECTATE:
+            await self.watch(conn, msg.content)
+            return
+        if msg.game_id:
+            if self.admit_multiplexed(conn):
+                await self.serve_multiplexed(conn, msg.game_id)
+            else:
+                conn.close()
+            return
+        if msg.content:
+            game_instance = self.resume_game(conn, msg)
+            if game_instance is not None:
+                await self.handle_client(game_instance, conn, msg.player)
+                return
+        await self.serve_waiting_player(conn)
+
+    async def watch(self, conn, sid):
+        """Keep a spectator subscribed until it disconnects or its game ends."""
+        watcher = StreamWatcher(conn)
+        game_instance = self.add_spectator(conn, sid, watcher)
+        if game_instance is None:
+            conn.close()
+            return
+        try:
+            while await conn.read_messages():
+                pass  # spectators have nothing to say to the game
+        except OSError:
+            pass
+        except Exception as e:
+            logging.error(f"Unexpected error with spectator: {e}", extra={'sid': game_instance.sid})
+        finally:
+            with game_instance.lock:
+                game_instance.spectators.remove(watcher)
+
+    async def serve_multiplexed(self, conn, game_id):
+        with self.multiplexed(conn, game_id) as mux:
+            while True:
+                messages = await conn.read_messages()
+                if not messages:
+                    break
+                for msg in messages:
+                    mux.dispatch(msg)
+
+    def seat_player(self, game_instance, conn, player):
+        """Hand a matched player its game; a board is served by its connection's reader."""
+        if not isinstance(conn, BoardChannel):
+            conn.paired.set_result((game_instance, conn, player))
+
+    async def serve_waiting_player(self, conn):
+        match = await self.wait_for_opponent(conn)
+        if isinstance(match, socket.socket):
+            await self.relay(conn, match)
+        elif match is not None:
+            await self.handle_client(*match)
+
+    @staticmethod
+    def take_waiting_player(conn):
+        return conn
+
+    def start_relay(self, conn, sock):
+        conn.paired.set_result(sock)  # serve_waiting_player relays it
+
+    def adopt_player(self, sock):
+        """Queue a player handed off by another worker; it already passed the version check."""
+        async def adopt():
+            reader, writer = await asyncio.open_connection(sock=sock)
+            await self.serve_waiting_player(StreamConnection(reader, writer))
+        asyncio.ensure_future(adopt())
+
+    async def relay(self, conn, sock):
+        reader, writer = await asyncio.open_connection(sock=sock)
+        writer.write(bytes(conn.decoder.buffer))
+
+        async def pump(source, destination):
+            try:
+                while True:
+                    data = await source.read(RECV_SIZE)
+                    if not data:
+                        break
+                    destination.write(data)
+                    await destination.drain()
+            except (ConnectionError, OSError):
+                pass
+            finally:
+                destination.close()
+
+        await asyncio.gather(pump(conn.reader, writer), pump(reader, conn.writer))
+
+    def add_waiting_player(self, conn):
+        if self.active_games >= self.max_games:
+            METRICS.capacity_waits.inc()
+        self.player_queue.add(conn, conn.variant, self.ratings.rating(conn.player_id))
+        if self.bot_after is not None and conn.variant == mnk.CLASSIC:
+            self.call_later(self.bot_after, self.call_soon, self.offer_bot, conn)
+        self.match_players()
+
+    async def wait_for_opponent(self, conn):
+        """Queue a connection until it is paired, or return None if it disconnects first."""
+        self.add_waiting_player(conn)
+        while not conn.paired.done():
+            read_task = asyncio.ensure_future(conn.reader.read(RECV_SIZE))
+            await asyncio.wait({conn.paired, read_task}, return_when=asyncio.FIRST_COMPLETED)
+            read_task.cancel()
+            try:
+                data = await read_task
+            except asyncio.CancelledError:
+                break
+            except (ConnectionError, OSError):
+                data = b""
+            if not data and not conn.paired.done():
+                self.player_queue.remove(conn)
+                conn.close()
+                return None
+            conn.decoder.feed(data)
+        return conn.paired.result()
+
+    def widen_rating_windows(self):
+        super().widen_rating_windows()
+        self.match_players()
+
+    async def handle_client(self, game, conn, player):
+        opponent = game.opponent(player)
+        held = False
+        try:
+            while True:
+                messages = await conn.read_messages()
+                if not messages:
+                    raise ConnectionError(f"Player {player} has disconnected.")
+                for msg in messages:
+                    game.handle_message(msg, conn, game.connections[opponent], player)
+                game.flush_chat()
+        except OSError as e:
+            logging.info(str(e) or f"Player {player} lost connection.", extra={'sid': game.sid})
+            held = game.player_dropped(player)
+        except Exception as e:
+            logging.error(f"Unexpected error with client: {e}", extra={'sid': game.sid})
+        finally:
+            conn.close()
+            if not held:
+                game.end_game()
@@ -0,0 +1,262 @@
+"""Microbenchmarks for the server's per-message hot paths.
+
+Each benchmark times one operation in isolation. The loop count is calibrated
+like timeit's autorange, the timing is repeated, and the per-call median,
+mean, spread and minimum go to a JSON file. Pass --compare with an earlier
+file to flag regressions before deploying:
+
+    python benchmarks.py --output baseline.json
+    python benchmarks.py --compare baseline.json --threshold 0.1
+
+The exit status is 1 when a benchmark's median is slower than the baseline by
+more than the threshold.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import platform
+import socket
+import statistics
+import sys
+import threading
+import timeit
+from tictactoe_pb2 import TicTacToeMessage, MessageType, PlayerType, PlayerShape
+from framing import MessageDecoder, encode_message
+from bitboard import Board
+from mnk import MNKBoard
+from server import TicTacToeServer, TicTacToeGame, ClientConnection
+import message_cache
+
+BENCHMARKS = {}
+
+SAMPLE_MESSAGES = {
+    MessageType.START: {"player": PlayerType.PLAYER_1, "content": "1a2b3c4d"},
+    MessageType.CHAT: {"content": "Opponent: good game, one more?"},
+    MessageType.MOVE: {"content": "4", "player": PlayerType.PLAYER_2, "win_type": 0,
+                       "is_your_turn": True, "player_shape": PlayerShape.X},
+    MessageType.RESET_REQUEST: {},
+    MessageType.RESET_CONFIRMATION: {"is_your_turn": True, "player_shape": PlayerShape.O},
+    MessageType.MESSAGE: {"content": "Opponent has disconnected"},
+    MessageType.PLAY_AGAIN: {},
+    MessageType.VERSION_CHECK: {"version": "1.1.0"},
+    MessageType.SNAPSHOT: {"content": "X-O-X-O--", "player": PlayerType.PLAYER_1,
+                           "player_shape": PlayerShape.X, "is_your_turn": True},
+    MessageType.LEAVE: {},
+    MessageType.SPECTATE: {"version": "1.1.0", "content": "1a2b3c4d"},
+}
+
+
+def benchmark(name):
+    """Register a generator that sets up, yields the callable to time, then cleans up."""
+    def register(function):
+        BENCHMARKS[name] = contextlib.contextmanager(function)
+        return function
+    return register
+
+
+class NullConnection:
+    """Connection that accepts and discards everything written to it."""
+
+    def send(self, data):
+        return len(data)
+
+
+@benchmark("win_check")
+def bench_win_check():
+    game = TicTacToeGame(TicTacToeServer(), "bench")
+    # A position with no winner yet, so every line has to be ruled out.
+    game.board = Board(x=0b010001100, o=0b000110010)
+    yield game.win_check
+
+
+@benchmark("mnk place[15,15,5]")
+def bench_mnk_place():
+    """A move in the middle of a busy 15x15 board, where every direction has to be walked."""
+    board = MNKBoard(15, 15, 5)
+    for square in (96, 97, 98, 110, 126, 127, 128, 140, 142):
+        board.place(square, PlayerShape.X if square % 2 else PlayerShape.O)
+    x, o, moves = board.x, board.o, board.moves
+
+    def place():
+        board.x, board.o, board.moves = x, o, moves
+        return board.place(112, PlayerShape.X)
+    yield place
+
+
+def register_message_benchmarks():
+    for msg_type, attributes in SAMPLE_MESSAGES.items():
+        type_name = MessageType.Name(msg_type)
+
+        def bench_serialize(msg_type=msg_type, attributes=attributes):
+            msg = TicTacToeMessage(type=msg_type, **attributes)
+            yield msg.SerializeToString
+
+        def bench_parse(msg_type=msg_type, attributes=attributes):
+            data = TicTacToeMessage(type=msg_type, **attributes).SerializeToString()
+            yield lambda: TicTacToeMessage().ParseFromString(data)
+
+        benchmark(f"serialize[{type_name}]")(bench_serialize)
+        benchmark(f"parse[{type_name}]")(bench_parse)
+
+
+register_message_benchmarks()
+
+
+@benchmark("decode_frame[MOVE]")
+def bench_decode_frame():
+    decoder = MessageDecoder()
+    frame = encode_message(TicTacToeMessage(type=MessageType.MOVE,
+                                            **SAMPLE_MESSAGES[MessageType.MOVE]))
+
+    def decode():
+        decoder.feed(frame)
+        return decoder.messages()
+    yield decode
+
+
+@benchmark("send_message[MOVE]")
+def bench_send_message():
+    game = TicTacToeGame(TicTacToeServer(), "bench")
+    conn = NullConnection()
+    attributes = dict(type=MessageType.MOVE, **SAMPLE_MESSAGES[MessageType.MOVE])
+    yield lambda: game.send_message(conn, **attributes)
+
+
+@benchmark("send_frames[MOVE, cached]")
+def bench_send_frames():
+    game = TicTacToeGame(TicTacToeServer(), "bench")
+    conn = NullConnection()
+
+    def send_move():
+        other_frame, own_frame = message_cache.move_frames(4, PlayerShape.X,
+                                                           PlayerType.PLAYER_2, 0)
+        game.send_frames(conn, other_frame)
+        game.send_frames(conn, own_frame)
+    yield send_move
+
+
+@benchmark("handle_client[MOVE round trip]")
+def bench_handle_client_move():
+    """One MOVE from the client's socket through handle_client and back to the client."""
+    game = TicTacToeGame(TicTacToeServer(), "bench")
+    client1, server1 = socket.socketpair()
+    client2, server2 = socket.socketpair()
+    conn1, conn2 = ClientConnection(server1), ClientConnection(server2)
+    game.connections = {PlayerType.PLAYER_1: conn1, PlayerType.PLAYER_2: conn2}
+    handler = threading.Thread(target=game.handle_client,
+                               args=(conn1, PlayerType.PLAYER_1), daemon=True)
+    handler.start()
+    move = encode_message(TicTacToeMessage(type=MessageType.MOVE, content="4"))
+    decoder1, decoder2 = MessageDecoder(), MessageDecoder()
+
+    def read_one(sock, decoder):
+        while True:
+            msg = decoder.next_message()
+            if msg is not None:
+                return msg
+            decoder.feed(sock.recv(4096))
+
+    def round_trip():
+        with game.lock:
+            game.board = Board()
+            game.current_turn = PlayerType.PLAYER_1
+            game.moves = []
+        client1.sendall(move)
+        read_one(client1, decoder1)
+        read_one(client2, decoder2)
+
+    try:
+        yield round_trip
+    finally:
+        client1.close()
+        handler.join()
+        for sock in (client2, server1, server2):
+            sock.close()
+
+
+def measure(function, runs, min_time):
+    timer = timeit.Timer(function)
+    loops, elapsed = timer.autorange()
+    if elapsed < min_time:
+        loops = max(loops, int(loops * min_time / elapsed) if elapsed else loops)
+    timings = [seconds / loops for seconds in timer.repeat(repeat=runs, number=loops)]
+    return {
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "min": min(timings),
+        "loops": loops,
+        "runs": runs,
+    }
+
+
+def run(names, runs, min_time):
+    results = {}
+    for name in names:
+        with BENCHMARKS[name]() as function:
+            results[name] = measure(function, runs, min_time)
+        result = results[name]
+        print(f"{name:40} {format_time(result['median']):>12} "
+              f"+- {format_time(result['stdev'])}")
+    return results
+
+
+def format_time(seconds):
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    if seconds >= 1e-6:
+        return f"{seconds * 1e6:.2f} us"
+    return f"{seconds * 1e9:.0f} ns"
+
+
+def compare(results, baseline, threshold):
+    """Print the change from the baseline per benchmark; returns the names that regressed."""
+    regressions = []
+    print()
+    for name, result in results.items():
+        previous = baseline["benchmarks"].get(name)
+        if previous is None:
+            print(f"{name:40} {'new':>12}")
+            continue
+        change = result["median"] / previous["median"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:40} {format_time(previous['median']):>12} -> "
+              f"{format_time(result['median']):>10} ({change:+.1%}){flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tic-Tac-Toe Online server microbenchmarks")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file written by an earlier --output")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="median slowdown beyond which --compare reports a regression "
+                             "(default: 0.10, i.e. 10%%)")
+    parser.add_argument("--runs", type=int, default=7, help="timed repetitions per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="minimum seconds per repetition")
+    parser.add_argument("--filter", default="",
+                        help="only run benchmarks whose name contains this text")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    names = [name for name in BENCHMARKS if args.filter in name]
+    results = run(names, args.runs, args.min_time)
+    document = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "benchmarks": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
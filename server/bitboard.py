@@ -0,0 +1,81 @@
+"""Tic-tac-toe board stored as two 9-bit masks, one per shape.
+
+Square i (0-8, row by row) is bit i of a mask. Moves are bit operations, and
+wins are found with WIN_LINE, a table precomputed over all 512 masks. This
+shared core is used by both the server and the client, so it has no
+dependencies.
+"""
+
+X = 1  # same values as PlayerShape.X and PlayerShape.O
+O = 2
+
+DRAW = 9
+FULL_BOARD = 0x1FF
+
+WIN_LINES = (
+    (0, 1, 2), (3, 4, 5), (6, 7, 8),  # Horizontal
+    (0, 3, 6), (1, 4, 7), (2, 5, 8),  # Vertical
+    (0, 4, 8), (2, 4, 6),             # Diagonal
+)
+LINE_MASKS = tuple(sum(1 << square for square in line) for line in WIN_LINES)
+
+# WIN_LINE[mask] is the 1-based index of the first line completed in mask, or 0.
+WIN_LINE = bytes(
+    next((index + 1 for index, line in enumerate(LINE_MASKS) if mask & line == line), 0)
+    for mask in range(512)
+)
+
+
+class Board:
+    __slots__ = ("x", "o")
+
+    def __init__(self, x=0, o=0):
+        self.x = x
+        self.o = o
+
+    def __getitem__(self, square):
+        """The shape on a square (X or O), or None if it is empty."""
+        bit = 1 << square
+        if self.x & bit:
+            return X
+        if self.o & bit:
+            return O
+        return None
+
+    def masks_for(self, shape):
+        """(shape's mask, opponent's mask), the form the move table is indexed by."""
+        return (self.x, self.o) if shape == X else (self.o, self.x)
+
+    def is_free(self, square):
+        return 0 <= square < 9 and not (self.x | self.o) >> square & 1
+
+    def free_squares(self):
+        occupied = self.x | self.o
+        return [square for square in range(9) if not occupied >> square & 1]
+
+    def place(self, square, shape):
+        """Put shape on a free square and return the resulting status (see status)."""
+        if shape == X:
+            self.x |= 1 << square
+            line = WIN_LINE[self.x]
+        else:
+            self.o |= 1 << square
+            line = WIN_LINE[self.o]
+        if line:
+            return line
+        return DRAW if self.x | self.o == FULL_BOARD else 0
+
+    def status(self):
+        """0 while the game is on, 1-8 for the completed line, 9 for a draw."""
+        line = WIN_LINE[self.x] or WIN_LINE[self.o]
+        if line:
+            return line
+        return DRAW if self.x | self.o == FULL_BOARD else 0
+
+    def winner(self):
+        """The shape that completed a line, or None."""
+        if WIN_LINE[self.x]:
+            return X
+        if WIN_LINE[self.o]:
+            return O
+        return None
@@ -0,0 +1,137 @@
+"""In-process bot opponents for players nobody else is around to play.
+
+A BotConnection stands in for the second player's socket: TicTacToeGame sends
+to it like any other connection, and it answers by calling handle_message
+itself. Bots never block a thread. Their moves are timers on a single
+scheduler (the Scheduler below for the threads engine, the event loop for
+asyncio), so thousands of bot games cost a heap entry each.
+"""
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from tictactoe_pb2 import TicTacToeMessage, MessageType
+from framing import MessageDecoder
+
+BOT_THINK_TIME = (0.5, 1.5)  # seconds, so bot moves do not land instantly
+
+
+class Timer:
+    __slots__ = ("when", "callback", "args", "cancelled")
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """Runs callbacks after a delay, all on one thread, ordered by a heap.
+
+    call_later has the same shape as asyncio's, so callers do not care which
+    engine they run under.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.timers = []
+        self.sequence = itertools.count()
+
+    def call_later(self, delay, callback, *args):
+        timer = Timer(time.monotonic() + delay, callback, args)
+        with self.condition:
+            heapq.heappush(self.timers, (timer.when, next(self.sequence), timer))
+            if self.timers[0][2] is timer:
+                self.condition.notify()
+        return timer
+
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    timeout = None
+                    if self.timers:
+                        timeout = self.timers[0][0] - time.monotonic()
+                        if timeout <= 0:
+                            break
+                    self.condition.wait(timeout)
+                _, _, timer = heapq.heappop(self.timers)
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                logging.error(f"Scheduled callback failed: {e}", extra={'sid': 'server'})
+
+
+class BotConnection:
+    """The bot's side of a game, shaped like a player connection but without a socket."""
+
+    def __init__(self, server):
+        self.server = server
+        self.player_id = ""  # bots play unrated
+        self.decoder = MessageDecoder()
+        self.game = None
+        self.player = None
+        self.timer = None
+        self.closed = False
+
+    def attach(self, game, player):
+        """Start playing; messages sent before this only matter for whose turn it is."""
+        self.game = game
+        self.player = player
+        if game.current_turn == player:
+            self.schedule(self.take_turn)
+
+    def send(self, data):
+        if self.closed:
+            raise BrokenPipeError("Bot has left the game")
+        self.decoder.feed(data)
+        for msg in self.decoder.messages():
+            if self.game is None:
+                continue
+            if msg.type in (MessageType.MOVE, MessageType.RESET_CONFIRMATION) and msg.is_your_turn:
+                self.schedule(self.take_turn)
+            elif msg.type == MessageType.PLAY_AGAIN:
+                self.schedule(self.request_reset)
+        return len(data)
+
+    def schedule(self, action):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = self.server.call_later(random.uniform(*BOT_THINK_TIME), action)
+
+    def take_turn(self):
+        with self.game.lock:
+            if self.closed or self.game.current_turn != self.player:
+                return
+            shape = self.game.player_shapes[self.player]
+            move = self.server.move_table.choose_move(self.game.board, shape,
+                                                      self.server.bot_skill)
+            if move is not None:
+                msg = TicTacToeMessage(type=MessageType.MOVE, content=str(move))
+                self.act(msg)
+
+    def request_reset(self):
+        with self.game.lock:
+            if not self.closed:
+                self.act(TicTacToeMessage(type=MessageType.RESET_REQUEST))
+
+    def act(self, msg):
+        """Play msg as the bot's own message; the caller holds the game lock."""
+        opponent_conn = self.game.connections[self.game.opponent(self.player)]
+        self.game.handle_message(msg, self, opponent_conn, self.player)
+
+    def shutdown(self, how):
+        self.close()
+
+    def close(self):
+        self.closed = True
+        if self.timer is not None:
+            self.timer.cancel()
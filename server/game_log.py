@@ -0,0 +1,262 @@
+"""Append-only log of finished games, for analysis and settling disputes.
+
+Each game is appended as one fixed-width binary record once it is won,
+drawn, or abandoned (by a rematch or a departure before it ended). Game
+threads and the event loop only hand a tuple to GameRecorder with put_nowait.
+A writer thread packs whatever has piled up and appends it in one write per
+file, and flushes after every batch. When the queue is full, the record is
+dropped and counted. It is never allowed to hold up a move.
+
+Records of different sizes cannot share a file, so there is one file per
+board variant and process:
+
+    games-<rows>x<columns>x<k>-<pid>.bin
+
+A file starts with FILE_HEADER: the magic bytes, the format version and the
+variant. Then come records of RECORD_HEADER followed by one slot per square
+for the move sequence (uint8, or uint16 on boards of more than 255 squares).
+A game uses `moves` of those slots, and the rest are zero. `result` is the
+board status when the game was recorded: 0 when abandoned, the draw value
+(9 on 3x3, -1 on other boards), and otherwise the winning line. All numbers
+are little-endian.
+
+GameLog memory-maps a file and yields GameRecord views into the map, so
+iterating a log copies nothing but the fields that are read. Its `records`
+buffer holds every complete record, for readers such as analytics.py that
+take the records as a whole.
+"""
+import argparse
+import atexit
+import logging
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from bitboard import DRAW as CLASSIC_DRAW
+import mnk
+from metrics import METRICS, Counter
+
+MAGIC = b"TTTG"
+FORMAT_VERSION = 1
+FILE_HEADER = struct.Struct("<4sBBBB")  # magic, version, rows, columns, k
+# sid, player 1's shape, first mover, result, moves, ended at (unix time), padding
+RECORD_HEADER = struct.Struct("<8sBBhHI2x")
+QUEUE_SIZE = 10000
+
+RECORDS = Counter("tictactoe_game_records_total",
+                  "Finished games handed to the game log, by outcome", label="outcome")
+METRICS.add_metric(RECORDS)
+
+
+def move_format(variant):
+    rows, columns, _ = variant
+    return "B" if rows * columns <= 0xFF else "H"
+
+
+def record_size(variant):
+    rows, columns, _ = variant
+    return RECORD_HEADER.size + rows * columns * struct.calcsize(move_format(variant))
+
+
+def log_name(variant, pid):
+    rows, columns, k = variant
+    return f"games-{rows}x{columns}x{k}-{pid}.bin"
+
+
+class GameRecorder:
+    """Queues finished games and appends them to the log files from one writer thread."""
+
+    def __init__(self, directory, queue_size=QUEUE_SIZE):
+        self.directory = directory
+        self.records = queue.Queue(maxsize=queue_size)
+        self.files = {}  # variant -> open log file
+        self.thread = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def record(self, sid, variant, player1_shape, first_mover, result, moves):
+        """Queue a game without blocking; it is dropped if the writer has fallen behind."""
+        try:
+            self.records.put_nowait((sid, variant, player1_shape, first_mover, result,
+                                     moves, int(time.time())))
+        except queue.Full:
+            RECORDS.inc(label_value="dropped")
+
+    def run(self):
+        while True:
+            batch = [self.records.get()]
+            while batch[-1] is not None:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            games = [game for game in batch if game is not None]
+            if games:
+                self.write(games)
+            if batch[-1] is None:
+                break
+        for log_file in self.files.values():
+            log_file.close()
+
+    def write(self, games):
+        chunks = {}
+        for sid, variant, player1_shape, first_mover, result, moves, ended_at in games:
+            rows, columns, _ = variant
+            chunks.setdefault(variant, []).append(
+                RECORD_HEADER.pack(sid.encode(), player1_shape, first_mover, result,
+                                   len(moves), ended_at)
+                + struct.pack(f"<{rows * columns}{move_format(variant)}",
+                              *moves, *[0] * (rows * columns - len(moves))))
+        for variant, records in chunks.items():
+            try:
+                log_file = self.open(variant)
+                log_file.write(b"".join(records))
+                log_file.flush()
+            except OSError as e:
+                RECORDS.inc(len(records), label_value="failed")
+                logging.error(f"Could not write the game log: {e}", extra={'sid': 'server'})
+            else:
+                RECORDS.inc(len(records), label_value="written")
+
+    def open(self, variant):
+        log_file = self.files.get(variant)
+        if log_file is None:
+            log_file = open(os.path.join(self.directory, log_name(variant, os.getpid())), "ab")
+            if log_file.tell() == 0:
+                log_file.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, *variant))
+            self.files[variant] = log_file
+        return log_file
+
+    def close(self):
+        """Write out what is queued and stop the writer."""
+        if self.thread is None or not self.thread.is_alive():
+            return
+        self.records.put(None)
+        self.thread.join(timeout=5)
+
+
+class GameRecord:
+    """One game, read in place from a memory-mapped log."""
+
+    __slots__ = ("view", "variant")
+
+    def __init__(self, view, variant):
+        self.view = view
+        self.variant = variant
+
+    @property
+    def sid(self):
+        return RECORD_HEADER.unpack_from(self.view)[0].rstrip(b"\0").decode()
+
+    @property
+    def player1_shape(self):
+        return self.view[8]
+
+    @property
+    def first_mover(self):
+        return self.view[9]
+
+    @property
+    def result(self):
+        return RECORD_HEADER.unpack_from(self.view)[3]
+
+    @property
+    def ended_at(self):
+        return RECORD_HEADER.unpack_from(self.view)[5]
+
+    @property
+    def moves(self):
+        """The squares played in order, as a memoryview of the record."""
+        # The cast reads in native byte order, which matches the file on little-endian hosts.
+        count = RECORD_HEADER.unpack_from(self.view)[4]
+        return self.view[RECORD_HEADER.size:].cast(move_format(self.variant))[:count]
+
+    @property
+    def winner(self):
+        """The player (1 or 2) who won, or 0 for a draw or an abandoned game."""
+        draw = CLASSIC_DRAW if self.variant == mnk.CLASSIC else mnk.DRAW
+        if self.result in (0, draw):
+            return 0
+        # Players alternate, so the last move was the first mover's when the count is odd.
+        if len(self.moves) % 2:
+            return self.first_mover
+        return 3 - self.first_mover
+
+
+class GameLog:
+    """A log file mapped into memory and read in place."""
+
+    def __init__(self, path):
+        with open(path, "rb") as log_file:
+            self.map = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if len(self.view) < FILE_HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a game log")
+        magic, version, rows, columns, k = FILE_HEADER.unpack_from(self.view)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} game log")
+        self.variant = (rows, columns, k)
+        self.record_size = record_size(self.variant)
+
+    def __len__(self):
+        # A record cut short by a crash mid-write is left out.
+        return (len(self.view) - FILE_HEADER.size) // self.record_size
+
+    @property
+    def records(self):
+        """The complete records, back to back, as one view into the map."""
+        return self.view[FILE_HEADER.size:FILE_HEADER.size + len(self) * self.record_size]
+
+    def __iter__(self):
+        records = self.records
+        for start in range(0, len(records), self.record_size):
+            yield GameRecord(records[start:start + self.record_size], self.variant)
+
+    def close(self):
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # records still referenced keep the map alive until they are freed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def print_games(game_log, sid=None):
+    board = mnk.variant_name(game_log.variant) or "3,3,3"
+    for game in game_log:
+        if sid and game.sid != sid:
+            continue
+        ended = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(game.ended_at))
+        print(f"{ended} {game.sid} board={board} first={game.first_mover} "
+              f"p1_shape={game.player1_shape} result={game.result} winner={game.winner} "
+              f"moves={' '.join(map(str, game.moves))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the games in Tic-Tac-Toe Online logs")
+    parser.add_argument("paths", nargs="+", help="game log files written with --record-dir")
+    parser.add_argument("--sid", help="only print the games of this session id")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        try:
+            game_log = GameLog(path)
+        except (OSError, ValueError) as e:
+            print(e, file=sys.stderr)
+            continue
+        with game_log:
+            print_games(game_log, args.sid)
@@ -0,0 +1,381 @@
+"""Headless load generator that plays real games against a running server.
+
+Every simulated player opens its own TLS connection, passes the version
+check, waits to be matched and then plays full games with random or
+scripted moves, optional chat and RESET_REQUEST rematches. With --boards,
+players share multiplexed connections instead, several boards to each.
+--variant plays an m,n,k board instead of 3x3, and --rated gives every
+player a player_id so the server matches them by rating. Simulated
+spectators can watch the most watched game meanwhile. The report covers
+matches per second, time to match, move round-trip percentiles and errors.
+
+    python loadgen.py --clients 500 --games 5 --chat 0.2 --spectators 100
+    python loadgen.py --clients 1000 --boards 20
+    python loadgen.py --clients 200 --variant 15,15,5
+
+Certificates are not verified, so it works against a local server using the
+self-signed certificate from the setup guide.
+"""
+import argparse
+import asyncio
+import random
+import secrets
+import ssl
+import time
+from collections import Counter
+from tictactoe_pb2 import TicTacToeMessage, MessageType
+from framing import MessageDecoder, encode_message
+import mnk
+
+VERSION = "1.1.0"
+RECV_SIZE = 4096
+SCRIPTED_MOVES = (4, 0, 2, 6, 8, 1, 3, 5, 7)  # centre, corners, edges; 3x3 only
+
+
+def new_player_id(options):
+    return f"load-{secrets.token_hex(6)}" if options.rated else ""
+
+
+class LoadStats:
+    def __init__(self):
+        self.connected = 0
+        self.matched = 0
+        self.games = 0
+        self.match_seconds = []
+        self.move_seconds = []
+        self.watched = 0
+        self.spectated_messages = 0
+        self.errors = Counter()
+
+
+class PlayerSession:
+    """One simulated player: a TLS connection and the board as the server reports it."""
+
+    def __init__(self, options, stats, link=None, game_id=0):
+        self.options = options
+        self.stats = stats
+        self.link = link  # the MultiplexedLink carrying this player's board, if any
+        self.game_id = game_id
+        self.decoder = MessageDecoder()
+        self.reader = None
+        self.writer = None
+        rows, columns, _ = options.variant
+        self.squares = range(rows * columns)
+        self.free_squares = set(self.squares)
+        self.my_turn = False
+        self.in_game = False
+
+    async def connect(self, context):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.options.host, self.options.port, ssl=context)
+
+    def send(self, **attributes):
+        if self.link is not None:
+            self.link.send(game_id=self.game_id, **attributes)
+            return
+        self.writer.write(encode_message(TicTacToeMessage(**attributes)))
+
+    async def receive(self):
+        """Wait for the next message from the server."""
+        if self.link is not None:
+            msg = await asyncio.wait_for(self.link.inboxes[self.game_id].get(),
+                                         self.options.timeout)
+            if msg is None:
+                raise ConnectionError("Server closed the connection")
+            return msg
+        while True:
+            msg = self.decoder.next_message()
+            if msg is not None:
+                return msg
+            data = await asyncio.wait_for(self.reader.read(RECV_SIZE), self.options.timeout)
+            if not data:
+                raise ConnectionError("Server closed the connection")
+            self.decoder.feed(data)
+
+    async def receive_type(self, *types):
+        """Wait for a message of one of the given types, following the game along the way."""
+        while True:
+            msg = await self.receive()
+            if msg.type in types:
+                return msg
+            self.observe(msg)
+
+    def observe(self, msg):
+        if msg.type == MessageType.MOVE:
+            self.free_squares.discard(int(msg.content))
+            self.my_turn = msg.is_your_turn
+        elif msg.type == MessageType.RESET_CONFIRMATION:
+            self.free_squares = set(self.squares)
+            self.my_turn = msg.is_your_turn
+        elif msg.type == MessageType.MESSAGE:
+            raise ConnectionError(msg.content)
+
+    def choose_move(self):
+        if self.options.moves == "scripted":
+            order = SCRIPTED_MOVES if self.options.variant == mnk.CLASSIC else self.squares
+            return next(square for square in order if square in self.free_squares)
+        return random.choice(sorted(self.free_squares))
+
+    async def version_check(self):
+        self.send(type=MessageType.VERSION_CHECK, version=VERSION,
+                  variant=mnk.variant_name(self.options.variant),
+                  player_id=new_player_id(self.options))
+        msg = await self.receive()
+        if msg.type != MessageType.VERSION_CHECK or msg.content != "VALID":
+            raise ConnectionError(f"Version check failed: {msg.content or msg.type}")
+
+    async def wait_for_match(self):
+        started_at = time.monotonic()
+        await self.receive_type(MessageType.START)
+        self.in_game = True
+        self.stats.matched += 1
+        self.stats.match_seconds.append(time.monotonic() - started_at)
+        self.observe(await self.receive_type(MessageType.RESET_CONFIRMATION))
+
+    async def play_game(self):
+        """Play until the server reports a win or a draw."""
+        while True:
+            if self.my_turn:
+                if random.random() < self.options.chat:
+                    self.send(type=MessageType.CHAT, content="good luck")
+                square = self.choose_move()
+                sent_at = time.monotonic()
+                self.send(type=MessageType.MOVE, content=str(square))
+                # The server answers the mover with its own MOVE once it has been applied.
+                msg = await self.receive_type(MessageType.MOVE)
+                self.stats.move_seconds.append(time.monotonic() - sent_at)
+            else:
+                msg = await self.receive_type(MessageType.MOVE)
+            self.observe(msg)
+            if msg.win_type:
+                self.stats.games += 1
+                return
+
+    async def rematch(self):
+        self.send(type=MessageType.RESET_REQUEST)
+        self.observe(await self.receive_type(MessageType.RESET_CONFIRMATION))
+
+    async def play(self):
+        await self.wait_for_match()
+        for game in range(self.options.games):
+            if game:
+                await self.rematch()
+            await self.play_game()
+
+    async def run(self, context):
+        try:
+            if self.link is None:
+                await self.connect(context)
+                await self.version_check()
+                self.stats.connected += 1
+            await self.play()
+        except asyncio.TimeoutError:
+            self.stats.errors["timeout"] += 1
+        except (ConnectionError, ssl.SSLError, OSError) as e:
+            self.stats.errors[type(e).__name__] += 1
+        finally:
+            if self.link is not None:
+                if self.in_game and not self.link.writer.is_closing():
+                    self.send(type=MessageType.LEAVE)
+            elif self.writer is not None:
+                if self.in_game and not self.writer.is_closing():
+                    # Without a LEAVE the server would hold the game open for a rejoin.
+                    self.send(type=MessageType.LEAVE)
+                self.writer.close()
+
+
+class MultiplexedLink:
+    """One connection shared by several simulated players, one board each."""
+
+    def __init__(self, options, stats, boards):
+        self.options = options
+        self.stats = stats
+        self.inboxes = {game_id: asyncio.Queue() for game_id in range(1, boards + 1)}
+        self.reader = None
+        self.writer = None
+        self.decoder = MessageDecoder()
+
+    def send(self, **attributes):
+        self.writer.write(encode_message(TicTacToeMessage(**attributes)))
+
+    async def version_check(self, context):
+        """Connect and pass the version check, which also opens board 1."""
+        self.reader, self.writer = await asyncio.open_connection(
+            self.options.host, self.options.port, ssl=context)
+        self.send(type=MessageType.VERSION_CHECK, version=VERSION, game_id=1,
+                  variant=mnk.variant_name(self.options.variant),
+                  player_id=new_player_id(self.options))
+        while True:
+            msg = self.decoder.next_message()
+            if msg is not None:
+                break
+            data = await asyncio.wait_for(self.reader.read(RECV_SIZE), self.options.timeout)
+            if not data:
+                raise ConnectionError("Server closed the connection")
+            self.decoder.feed(data)
+        if msg.type != MessageType.VERSION_CHECK or msg.content != "VALID":
+            raise ConnectionError(f"Version check failed: {msg.content or msg.type}")
+
+    async def read_loop(self):
+        """Hand every message to the inbox of its board."""
+        try:
+            while True:
+                for msg in self.decoder.messages():
+                    if msg.game_id in self.inboxes:
+                        self.inboxes[msg.game_id].put_nowait(msg)
+                data = await self.reader.read(RECV_SIZE)
+                if not data:
+                    break
+                self.decoder.feed(data)
+        except (ConnectionError, ssl.SSLError, OSError):
+            pass
+        finally:
+            for inbox in self.inboxes.values():
+                inbox.put_nowait(None)
+
+    async def run(self, context):
+        try:
+            await self.version_check(context)
+        except asyncio.TimeoutError:
+            self.stats.errors["timeout"] += len(self.inboxes)
+        except (ConnectionError, ssl.SSLError, OSError) as e:
+            self.stats.errors[type(e).__name__] += len(self.inboxes)
+        else:
+            self.stats.connected += len(self.inboxes)
+            for game_id in self.inboxes:
+                if game_id != 1:
+                    self.send(type=MessageType.START, game_id=game_id,
+                              variant=mnk.variant_name(self.options.variant),
+                              player_id=new_player_id(self.options))
+            reading = asyncio.ensure_future(self.read_loop())
+            await asyncio.gather(*(PlayerSession(self.options, self.stats, self, game_id)
+                                   .run(context) for game_id in self.inboxes))
+            reading.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class SpectatorSession:
+    """One simulated spectator, watching game after game until cancelled."""
+
+    def __init__(self, options, stats):
+        self.options = options
+        self.stats = stats
+
+    async def watch_one(self, context):
+        reader, writer = await asyncio.open_connection(self.options.host, self.options.port,
+                                                       ssl=context)
+        decoder = MessageDecoder()
+        joined = False
+        try:
+            writer.write(encode_message(TicTacToeMessage(type=MessageType.SPECTATE,
+                                                         version=VERSION)))
+            while True:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    return
+                decoder.feed(data)
+                for msg in decoder.messages():
+                    if msg.type == MessageType.SNAPSHOT and not joined:
+                        joined = True  # later snapshots are rematches of the same game
+                        self.stats.watched += 1
+                    if msg.type != MessageType.VERSION_CHECK:
+                        self.stats.spectated_messages += 1
+        finally:
+            writer.close()
+
+    async def run(self, context):
+        while True:
+            try:
+                await self.watch_one(context)
+            except (ConnectionError, ssl.SSLError, OSError) as e:
+                self.stats.errors[f"spectator {type(e).__name__}"] += 1
+            await asyncio.sleep(0.1)  # there may be no game to watch yet
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values, or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def format_ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.2f} ms"
+
+
+def report(stats, options, elapsed):
+    print(f"Clients:        {options.clients} ({stats.connected} passed the version check)")
+    print(f"Elapsed:        {elapsed:.2f} s")
+    print(f"Matches:        {stats.matched // 2} ({stats.matched / 2 / elapsed:.1f}/s)")
+    print(f"Games finished: {stats.games // 2} ({stats.games / 2 / elapsed:.1f}/s)")
+    print(f"Time to match:  p50 {format_ms(percentile(stats.match_seconds, 0.5))}, "
+          f"p99 {format_ms(percentile(stats.match_seconds, 0.99))}")
+    if options.spectators:
+        print(f"Spectators:     {options.spectators}, {stats.watched} games joined, "
+              f"{stats.spectated_messages} messages received")
+    print(f"Move RTT:       p50 {format_ms(percentile(stats.move_seconds, 0.5))}, "
+          f"p99 {format_ms(percentile(stats.move_seconds, 0.99))}, "
+          f"p999 {format_ms(percentile(stats.move_seconds, 0.999))} "
+          f"over {len(stats.move_seconds)} moves")
+    errors = ", ".join(f"{name} {count}" for name, count in stats.errors.most_common())
+    print(f"Errors:         {errors or 'none'}")
+
+
+async def main(options):
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    stats = LoadStats()
+
+    async def start_session(index, boards):
+        if options.ramp:
+            await asyncio.sleep(options.ramp * index / options.clients)
+        if boards > 1:
+            await MultiplexedLink(options, stats, boards).run(context)
+        else:
+            await PlayerSession(options, stats).run(context)
+
+    started_at = time.monotonic()
+    spectators = [asyncio.ensure_future(SpectatorSession(options, stats).run(context))
+                  for _ in range(options.spectators)]
+    boards = max(1, options.boards)
+    await asyncio.gather(*(start_session(index, min(boards, options.clients - index))
+                           for index in range(0, options.clients, boards)))
+    elapsed = time.monotonic() - started_at
+    for spectator in spectators:
+        spectator.cancel()
+    await asyncio.gather(*spectators, return_exceptions=True)
+    report(stats, options, elapsed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tic-Tac-Toe Online load generator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=52423)
+    parser.add_argument("--clients", type=int, default=100,
+                        help="number of simulated players, each with its own connection")
+    parser.add_argument("--games", type=int, default=3,
+                        help="games each pair plays, the first one plus rematches")
+    parser.add_argument("--moves", choices=["random", "scripted"], default="random",
+                        help="'scripted' always takes the first free square of a fixed order "
+                             "(the lowest free square on other boards than 3x3)")
+    parser.add_argument("--chat", type=float, default=0.0,
+                        help="chance of sending a chat message before each move")
+    parser.add_argument("--variant", type=mnk.parse_variant, default=mnk.CLASSIC,
+                        help="board as m,n,k: rows, columns and how many in a row win, "
+                             "e.g. 15,15,5 (default: classic 3x3)")
+    parser.add_argument("--rated", action="store_true",
+                        help="send a player_id for every simulated player, so games are rated "
+                             "and matched by rating")
+    parser.add_argument("--boards", type=int, default=1,
+                        help="players sharing each connection, one multiplexed board each")
+    parser.add_argument("--spectators", type=int, default=0,
+                        help="simulated spectators, each watching the most watched game")
+    parser.add_argument("--ramp", type=float, default=0.0,
+                        help="seconds over which to spread the initial connections")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="seconds to wait for any single server message")
+    asyncio.run(main(parser.parse_args()))
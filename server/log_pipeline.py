@@ -0,0 +1,133 @@
+"""Logging that stays off the game threads.
+
+setup_logging routes every record through a bounded queue to one listener
+thread, which does the formatting and the writes to stderr. Game and
+handshake threads only pay for a filter check and a put_nowait: when the
+queue is full the record is dropped and counted instead of blocking a move.
+
+Records tagged with an event (extra={'sid': ..., 'event': 'move'}) are the
+high-volume ones. Each sid gets a token bucket for them, so one busy game
+cannot flood the log; warnings and errors are never sampled out.
+"""
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+from metrics import METRICS, Counter
+
+TEXT_FORMAT = "%(asctime)s:%(levelname)s:%(sid)s:%(message)s"
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "error": logging.ERROR,
+    "off": logging.CRITICAL,
+}
+MAX_SAMPLED_SIDS = 10000
+
+DROPPED = Counter("tictactoe_log_records_dropped_total",
+                  "Log records discarded before being written, by reason", label="reason")
+METRICS.add_metric(DROPPED)
+
+active_options = None
+
+
+def ensure_sid(record):
+    """Give records from other libraries the sid field the formats expect."""
+    if not hasattr(record, "sid"):
+        record.sid = "-"
+    return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the record's sid and event as fields."""
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "sid": getattr(record, "sid", None),
+            "message": record.getMessage(),
+        }
+        event = getattr(record, "event", None)
+        if event is not None:
+            entry["event"] = event
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class SidSampler(logging.Filter):
+    """Rate-limit event records per sid with a token bucket (rate per second, burst)."""
+
+    def __init__(self, rate, burst):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()  # sid -> (tokens, last refill time)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or getattr(record, "event", None) is None:
+            return True
+        sid = getattr(record, "sid", None)
+        now = time.monotonic()
+        with self.lock:
+            tokens, refilled_at = self.buckets.pop(sid, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - refilled_at) * self.rate)
+            allowed = tokens >= 1
+            self.buckets[sid] = (tokens - 1 if allowed else tokens, now)
+            if len(self.buckets) > MAX_SAMPLED_SIDS:
+                self.buckets.popitem(last=False)
+        if not allowed:
+            DROPPED.inc(label_value="sampled")
+        return allowed
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the listener falls behind."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc(label_value="queue_full")
+
+
+def setup_logging(json_output=False, queue_size=10000, sample_rate=2.0, sample_burst=20):
+    """Replace the root logger's handlers with the queue pipeline and start its listener."""
+    global active_options
+    active_options = dict(json_output=json_output, queue_size=queue_size,
+                          sample_rate=sample_rate, sample_burst=sample_burst)
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT))
+    output.addFilter(ensure_sid)
+    records = queue.Queue(maxsize=queue_size)
+    handler = DroppingQueueHandler(records)
+    handler.addFilter(SidSampler(sample_rate, sample_burst))
+
+    root = logging.getLogger()
+    for old_handler in list(root.handlers):
+        root.removeHandler(old_handler)
+    root.addHandler(handler)
+
+    listener = QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def set_log_level(level):
+    if level.lower() not in LOG_LEVELS:
+        print("Invalid log level. Available options are 'debug', 'info', 'error', and 'off'.")
+        return
+    logging.getLogger().setLevel(LOG_LEVELS[level.lower()])
+    if level.lower() == "off":
+        print("Logging has been disabled")
+    else:
+        print(f"Log level has been set to {level.upper()}")
@@ -0,0 +1,229 @@
+import bisect
+import heapq
+import itertools
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+from metrics import METRICS
+from ratings import DEFAULT_RATING
+
+INITIAL_WINDOW = 100.0  # rating gap accepted straight away
+WINDOW_GROWTH = 25.0  # extra gap accepted per second of waiting
+MATCH_INTERVAL = 1.0  # seconds between retries while windows widen
+RECENT_MATCHES = 1000  # matched players the median time to match is taken over
+BUCKET_WIDTH = 25.0  # rating span of one bucket of waiting players
+COMPACT_SLACK = 64  # stale candidates tolerated beyond two per waiting player
+
+
+def rating_window(waited):
+    """Largest rating gap a player who has waited this many seconds accepts."""
+    return INITIAL_WINDOW + WINDOW_GROWTH * waited
+
+
+class RatingLadder:
+    """One group's waiting players, in buckets of BUCKET_WIDTH rating points.
+
+    A bucket keeps its players in arrival order. The occupied bucket numbers
+    are kept sorted, so the buckets around a rating are found by bisection.
+    How many there are depends on the spread of ratings, not on how many
+    players are waiting.
+    """
+
+    def __init__(self):
+        self.buckets = {}  # bucket number -> OrderedDict of player -> rating
+        self.numbers = []  # occupied bucket numbers, sorted
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, player, rating):
+        number = int(rating // BUCKET_WIDTH)
+        bucket = self.buckets.get(number)
+        if bucket is None:
+            bucket = self.buckets[number] = OrderedDict()
+            bisect.insort(self.numbers, number)
+        bucket[player] = rating
+        self.size += 1
+
+    def remove(self, player, rating):
+        number = int(rating // BUCKET_WIDTH)
+        bucket = self.buckets[number]
+        del bucket[player]
+        self.size -= 1
+        if not bucket:
+            del self.buckets[number]
+            del self.numbers[bisect.bisect_left(self.numbers, number)]
+
+    def nearby(self, rating):
+        """The occupied buckets at rating and on either side of it (at most three)."""
+        index = bisect.bisect_left(self.numbers, int(rating // BUCKET_WIDTH))
+        return [self.buckets[number] for number in self.numbers[max(index - 1, 0):index + 2]]
+
+    def nearest(self, player, rating):
+        """The closest rated other player and the gap, or (None, None) if there is none.
+
+        Each nearby bucket offers its longest waiting player, so players of
+        equal rating are paired first come, first served.
+        """
+        best, best_gap = None, None
+        for bucket in self.nearby(rating):
+            for other, other_rating in bucket.items():
+                if other is not player:
+                    gap = abs(other_rating - rating)
+                    if best is None or gap < best_gap:
+                        best, best_gap = other, gap
+                    break
+        return best, best_gap
+
+    def representatives(self, rating):
+        """The longest waiting player of each bucket around rating."""
+        return [next(iter(bucket)) for bucket in self.nearby(rating)]
+
+
+class PlayerQueue:
+    """Waiting room that pairs players of close rating, as soon as their windows allow.
+
+    Players only play others in the same group (the board variant they asked
+    for), kept in a RatingLadder per group. Whenever a player arrives, or the
+    player someone else was closest to leaves, the queue looks up that
+    player's closest opponent and pushes the pair onto a heap. The heap is
+    keyed by when the pair becomes acceptable: when the window of the longer
+    waiting of the two, which widens with every second waited, covers their
+    rating gap. find_pair only looks at pairs that have come due, and drops
+    the ones whose players are gone, so no call rescans the waiting players.
+    Unrated players all have DEFAULT_RATING, so they are paired at once,
+    first come, first served.
+    """
+
+    def __init__(self):
+        self.waiting = OrderedDict()  # player -> (queued at, group, rating), in arrival order
+        self.ladders = {}  # group -> RatingLadder
+        self.candidates = []  # heap of (due, seq, player, opponent)
+        self.sequence = itertools.count()
+        self.recent_waits = deque(maxlen=RECENT_MATCHES)
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def __contains__(self, player):
+        return player in self.waiting
+
+    def add(self, player, group=None, rating=DEFAULT_RATING):
+        self.waiting[player] = (time.monotonic(), group, rating)
+        self.ladders.setdefault(group, RatingLadder()).add(player, rating)
+        self.propose(player)
+
+    def propose(self, player):
+        """Push the pair of player and its closest opponent, due once its gap is acceptable."""
+        queued_at, group, rating = self.waiting[player]
+        opponent, gap = self.ladders[group].nearest(player, rating)
+        if opponent is None:
+            return
+        # The longer waiting of the two has the wider window.
+        started_at = min(queued_at, self.waiting[opponent][0])
+        due = started_at + max(gap - INITIAL_WINDOW, 0.0) / WINDOW_GROWTH
+        heapq.heappush(self.candidates, (due, next(self.sequence), player, opponent))
+
+    def waited(self, player):
+        """Seconds the player has been waiting so far."""
+        return time.monotonic() - self.waiting[player][0]
+
+    def remove(self, player, matched=False):
+        """Drop a player; returns False if it was no longer waiting.
+
+        matched counts the wait towards the time to match.
+        """
+        entry = self.waiting.pop(player, None)
+        if entry is None:
+            return False
+        queued_at, group, rating = entry
+        ladder = self.ladders[group]
+        ladder.remove(player, rating)
+        if matched:
+            wait = time.monotonic() - queued_at
+            METRICS.time_to_match.observe(wait)
+            self.recent_waits.append(wait)
+        if ladder:
+            # Whoever had this player as their closest opponent needs a new one.
+            for neighbour in ladder.representatives(rating):
+                self.propose(neighbour)
+        else:
+            del self.ladders[group]
+        return True
+
+    def find_pair(self):
+        """The next two players to pair, left in the queue, or None if nobody fits yet."""
+        now = time.monotonic()
+        candidates = self.candidates
+        while candidates and candidates[0][0] <= now:
+            _, _, player, opponent = candidates[0]
+            if player in self.waiting and opponent in self.waiting:
+                return player, opponent
+            heapq.heappop(candidates)
+            for remaining in (player, opponent):
+                if remaining in self.waiting:
+                    self.propose(remaining)
+        if len(candidates) > 2 * len(self.waiting) + COMPACT_SLACK:
+            self.compact()
+        return None
+
+    def compact(self):
+        """Rebuild the heap with one fresh pair per player, dropping the stale ones."""
+        self.candidates = []
+        for player in self.waiting:
+            self.propose(player)
+
+    def pop_pair(self, pair):
+        """Take a pair returned by find_pair out of the queue."""
+        for player in pair:
+            self.remove(player, matched=True)
+        return pair
+
+    def median_wait(self):
+        """Median time to match over the last RECENT_MATCHES matched players."""
+        return statistics.median(self.recent_waits) if self.recent_waits else 0.0
+
+    def peek_oldest(self):
+        """The longest waiting player, left in the queue, or None if nobody is waiting."""
+        return next(iter(self.waiting), None)
+
+    def pop_oldest(self):
+        """Pop the longest waiting player, or return None if nobody is waiting."""
+        player = self.peek_oldest()
+        if player is not None:
+            self.remove(player)
+        return player
+
+
+class GameSlots:
+    """Thread-safe count of running games against the max_games limit.
+
+    Callbacks registered with on_release run every time a game ends, so whoever
+    is holding players back for lack of capacity is woken straight away instead
+    of polling.
+    """
+
+    def __init__(self, limit):
+        self.lock = threading.Lock()
+        self.limit = limit
+        self.active = 0
+        self.release_callbacks = []
+
+    def on_release(self, callback):
+        self.release_callbacks.append(callback)
+
+    def try_acquire(self):
+        """Reserve a slot for a new game; returns False when the server is full."""
+        with self.lock:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+        for callback in self.release_callbacks:
+            callback()
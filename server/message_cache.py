@@ -0,0 +1,121 @@
+"""Server messages encoded once at import instead of on every send.
+
+Most of what the server sends comes from a small, fixed set: a MOVE is fully
+described by the square, the mover's shape, whose turn is next and the game
+status, and each has one variant per player (only is_your_turn differs).
+Every such message, and the copy spectators get, is serialized and framed
+here up front, so sending one is a dict lookup. Messages carrying per-game
+strings (START) are built by appending the string fields to a pre-encoded
+prefix, which protobuf parses the same as a full serialization.
+
+A frame is a (type name, bytes) pair, the name being what the metrics count.
+"""
+from tictactoe_pb2 import TicTacToeMessage, MessageType, PlayerType, PlayerShape
+from framing import encode_frame, encode_varint
+from mnk import MAX_SIDE
+
+CONTENT_FIELD = 2
+RESUME_TOKEN_FIELD = 8
+VARIANT_FIELD = 10
+LENGTH_DELIMITED = 2
+
+PLAYERS = (PlayerType.UNKNOWN_PLAYER, PlayerType.PLAYER_1, PlayerType.PLAYER_2)
+SHAPES = (PlayerShape.X, PlayerShape.O)
+GAME_STATUSES = range(10)  # 0 ongoing, 1-8 the winning line, 9 a draw
+
+
+def encode(**attributes):
+    """Frame for a message that is not cached."""
+    msg = TicTacToeMessage(**attributes)
+    return MessageType.Name(msg.type), encode_frame(msg.SerializeToString())
+
+
+def encode_string_field(number, value):
+    data = value.encode()
+    return encode_varint(number << 3 | LENGTH_DELIMITED) + encode_varint(len(data)) + data
+
+
+PLAY_AGAIN = encode(type=MessageType.PLAY_AGAIN)
+OPPONENT_DISCONNECTED = encode(type=MessageType.MESSAGE, content="Opponent has disconnected")
+OPPONENT_RECONNECTED = encode(type=MessageType.MESSAGE, content="Opponent has reconnected")
+GAME_ENDED = encode(type=MessageType.MESSAGE,
+                    content="Your previous game has ended, searching for a new match")
+GAME_OVER = encode(type=MessageType.MESSAGE, content="The game has ended")
+NOTHING_TO_WATCH = encode(type=MessageType.MESSAGE, content="That game is not running")
+BOARD_REFUSED = encode(type=MessageType.MESSAGE,
+                       content="Cannot open that board: its game_id is in use or 0, "
+                               "or too many boards are open")
+UNSUPPORTED_VARIANT = encode(type=MessageType.MESSAGE,
+                             content=f"Unsupported board: use m,n,k with sides of 3 to "
+                                     f"{MAX_SIDE} and k from 3 to the longer side")
+TOO_MANY_MULTIPLEXED = encode(type=MessageType.MESSAGE,
+                              content="Too many multiplexed connections, try again later")
+TOO_MANY_SPECTATORS = encode(type=MessageType.MESSAGE,
+                             content="Too many spectators, try again later")
+VERSION_VALID = encode(type=MessageType.VERSION_CHECK, content="VALID")
+VERSION_INVALID = encode(type=MessageType.VERSION_CHECK, content="INVALID")
+
+RESET_CONFIRMATIONS = {
+    (is_your_turn, shape): encode(type=MessageType.RESET_CONFIRMATION,
+                                  is_your_turn=is_your_turn, player_shape=shape)
+    for is_your_turn in (False, True) for shape in SHAPES
+}
+
+START_PREFIXES = {player: TicTacToeMessage(type=MessageType.START, player=player)
+                  .SerializeToString() for player in PLAYERS}
+
+
+def build_moves():
+    moves = {}
+    spectated_moves = {}
+    for square in range(9):
+        for shape in SHAPES:
+            for next_turn in PLAYERS:
+                for status in GAME_STATUSES:
+                    key = square, shape, next_turn, status
+                    attributes = dict(type=MessageType.MOVE, content=str(square),
+                                      player=next_turn, win_type=status, player_shape=shape)
+                    moves[key] = (
+                        encode(is_your_turn=status == 0, **attributes),
+                        encode(is_your_turn=status != 0, **attributes),
+                    )
+                    spectated_moves[key] = encode(**attributes)
+    return moves, spectated_moves
+
+
+MOVES, SPECTATED_MOVES = build_moves()
+
+
+def move_frames(square, shape, next_turn, status):
+    """(frame for the opponent, frame for the mover) announcing a move.
+
+    Only classic 3x3 moves are cached; moves on larger boards are encoded here.
+    """
+    frames = MOVES.get((square, shape, next_turn, status))
+    if frames is None:
+        attributes = dict(type=MessageType.MOVE, content=str(square), player=next_turn,
+                          win_type=status, player_shape=shape)
+        frames = (encode(is_your_turn=status == 0, **attributes),
+                  encode(is_your_turn=status != 0, **attributes))
+    return frames
+
+
+def spectated_move(square, shape, next_turn, status):
+    """The same move for spectators, for whom it is never their turn."""
+    frame = SPECTATED_MOVES.get((square, shape, next_turn, status))
+    if frame is None:
+        frame = encode(type=MessageType.MOVE, content=str(square), player=next_turn,
+                       win_type=status, player_shape=shape)
+    return frame
+
+
+def reset_confirmation(is_your_turn, shape):
+    return RESET_CONFIRMATIONS[is_your_turn, shape]
+
+
+def start_frame(sid, player, resume_token, variant=""):
+    payload = (START_PREFIXES[player] + encode_string_field(CONTENT_FIELD, sid)
+               + encode_string_field(RESUME_TOKEN_FIELD, resume_token))
+    if variant:
+        payload += encode_string_field(VARIANT_FIELD, variant)
+    return "START", encode_frame(payload)
@@ -0,0 +1,157 @@
+"""Process-wide metrics, served over HTTP in the Prometheus text format.
+
+Counters and histograms are updated from every handler thread (or the event
+loop), so each one guards its numbers with its own lock; an update is a dict
+or list increment under an uncontended lock. Gauges are read from the
+server when scraped instead of being kept up to date.
+"""
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    def __init__(self, name, help_text, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, label_value=None):
+        with self.lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            values = sorted(self.values.items(), key=lambda item: str(item[0]))
+        if self.label is None:
+            lines.append(f"{self.name} {values[0][1] if values else 0}")
+        for label_value, value in values:
+            if self.label is not None:
+                lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value}')
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge",
+                f"{self.name} {self.read()}"]
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(self.buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.accepted = Counter("tictactoe_accepted_total",
+                                "Connections that passed the TLS handshake and version check")
+        self.rejected = Counter("tictactoe_rejected_total",
+                                "Connections turned away, by reason", label="reason")
+        self.tls_handshakes = Counter("tictactoe_tls_handshakes_total",
+                                      "Completed TLS handshakes, full or resumed", label="kind")
+        self.rejoins = Counter("tictactoe_rejoins_total",
+                               "Reconnects that asked for a held game, by result", label="result")
+        self.chat_dropped = Counter("tictactoe_chat_dropped_total",
+                                    "Chat messages not relayed, by reason", label="reason")
+        self.spectators_dropped = Counter("tictactoe_spectators_dropped_total",
+                                          "Spectators let go before their game ended, by reason",
+                                          label="reason")
+        self.capacity_waits = Counter("tictactoe_capacity_waits_total",
+                                      "Players queued while every game slot was taken")
+        self.messages_received = Counter("tictactoe_messages_received_total",
+                                         "Messages received from players, by type", label="type")
+        self.messages_sent = Counter("tictactoe_messages_sent_total",
+                                     "Messages sent to players, by type", label="type")
+        self.bytes_received = Counter("tictactoe_bytes_received_total",
+                                      "Bytes read from player connections")
+        self.bytes_sent = Counter("tictactoe_bytes_sent_total",
+                                  "Bytes written to player connections")
+        self.time_to_match = Histogram(
+            "tictactoe_time_to_match_seconds", "Time players spent queued before a game",
+            (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+        self.move_seconds = Histogram(
+            "tictactoe_move_processing_seconds", "Server time spent handling one MOVE",
+            (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01, 0.1))
+        self.gauges = []
+        self.extra = []
+
+    def add_gauge(self, name, help_text, read):
+        self.gauges.append(Gauge(name, help_text, read))
+
+    def add_metric(self, metric):
+        """Serve a metric defined elsewhere alongside the built-in ones."""
+        self.extra.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in (*self.gauges, self.accepted, self.rejected, self.tls_handshakes,
+                       self.rejoins, self.chat_dropped, self.spectators_dropped,
+                       self.capacity_waits,
+                       self.messages_received, self.messages_sent, self.bytes_received,
+                       self.bytes_sent, self.time_to_match, self.move_seconds, *self.extra):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """Serve /metrics from a background thread."""
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics", extra={'sid': 'server'})
+    return httpd
@@ -0,0 +1,116 @@
+"""m,n,k boards: m rows by n columns, won by k in a row.
+
+Classic tic-tac-toe is 3,3,3 and keeps using bitboard.Board, whose win table
+and the move cache and bots built on it only exist for 3x3. Other variants,
+such as 15,15,5 five-in-a-row, use MNKBoard. A lookup table over every mask
+is out of the question at that size, and so is rescanning every line after
+each move. A new line can only pass through the stone just placed, so place()
+walks the four directions from that square: at most 4 * 2 * (k - 1) squares
+per move, however big the board.
+
+MNKBoard has the same interface as bitboard.Board. Its status values differ:
+0 while the game is on, DRAW (-1) for a full board, and otherwise
+1 + 4 * start + direction, where start is the first square of the winning k
+squares and direction indexes DIRECTIONS.
+"""
+from bitboard import Board, X, O
+
+CLASSIC = (3, 3, 3)
+MAX_SIDE = 19
+DRAW = -1
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))  # (rows, columns) per step
+
+
+class MNKBoard:
+    __slots__ = ("rows", "columns", "k", "x", "o", "moves", "result")
+
+    def __init__(self, rows, columns, k):
+        self.rows = rows
+        self.columns = columns
+        self.k = k
+        self.x = 0
+        self.o = 0
+        self.moves = 0
+        self.result = 0
+
+    def __getitem__(self, square):
+        """The shape on a square (X or O), or None if it is empty."""
+        if self.x >> square & 1:
+            return X
+        if self.o >> square & 1:
+            return O
+        return None
+
+    def is_free(self, square):
+        return 0 <= square < self.rows * self.columns and not (self.x | self.o) >> square & 1
+
+    def free_squares(self):
+        occupied = self.x | self.o
+        return [square for square in range(self.rows * self.columns)
+                if not occupied >> square & 1]
+
+    def place(self, square, shape):
+        """Put shape on a free square and return the resulting status (see status)."""
+        bit = 1 << square
+        if shape == X:
+            self.x |= bit
+            mask = self.x
+        else:
+            self.o |= bit
+            mask = self.o
+        self.moves += 1
+        self.result = self.line_through(mask, square)
+        if not self.result and self.moves == self.rows * self.columns:
+            self.result = DRAW
+        return self.result
+
+    def line_through(self, mask, square):
+        """Status for a k-in-a-row of mask through square, or 0 if there is none."""
+        row, column = divmod(square, self.columns)
+        for direction, (row_step, column_step) in enumerate(DIRECTIONS):
+            # Walk back to where the run through square starts, then count forward.
+            start_row, start_column = row, column
+            for _ in range(self.k - 1):
+                r, c = start_row - row_step, start_column - column_step
+                if not (0 <= r < self.rows and 0 <= c < self.columns
+                        and mask >> (r * self.columns + c) & 1):
+                    break
+                start_row, start_column = r, c
+            length = 1 + max(abs(row - start_row), abs(column - start_column))
+            r, c = row + row_step, column + column_step
+            while (length < self.k and 0 <= r < self.rows and 0 <= c < self.columns
+                   and mask >> (r * self.columns + c) & 1):
+                length += 1
+                r, c = r + row_step, c + column_step
+            if length >= self.k:
+                return 1 + 4 * (start_row * self.columns + start_column) + direction
+        return 0
+
+    def status(self):
+        """0 while the game is on, DRAW for a full board, otherwise the winning line."""
+        return self.result
+
+    def winner(self):
+        """The shape that completed a line, or None."""
+        if self.result in (0, DRAW):
+            return None
+        return self[(self.result - 1) // 4]
+
+
+def parse_variant(text):
+    """(rows, columns, k) from "m,n,k"; empty means CLASSIC. Raises ValueError if unsupported."""
+    if not text:
+        return CLASSIC
+    rows, columns, k = (int(part) for part in text.split(","))
+    if not (3 <= rows <= MAX_SIDE and 3 <= columns <= MAX_SIDE and 3 <= k <= max(rows, columns)):
+        raise ValueError(f"Unsupported board {text}")
+    return rows, columns, k
+
+
+def variant_name(variant):
+    """The variant as sent on the wire; empty for CLASSIC so classic messages do not change."""
+    return "" if variant == CLASSIC else ",".join(map(str, variant))
+
+
+def new_board(variant):
+    return Board() if variant == CLASSIC else MNKBoard(*variant)
@@ -0,0 +1,160 @@
+"""Many boards over one client connection.
+
+A client that sends its VERSION_CHECK with a non-zero game_id gets a
+multiplexed connection. That first game_id is its first board, and sending
+START with a new game_id opens another. Every message in either direction
+carries the game_id of its board, and LEAVE with a game_id gives up just that
+board. START, like the VERSION_CHECK, may name a board variant, so one
+connection can play boards of different sizes, and a player_id, so each board
+can be rated as a different player. Boards are matched and played like
+separate players, but the connection has a single reader (a thread, or a task
+under asyncio) that hands each message to its board's game. The handshake,
+socket and reader are paid for once, however many boards are in play.
+
+Connections that send no game_id are served exactly as before. Boards are not
+held for a rejoin: if the connection drops, all of its games end.
+"""
+import logging
+import threading
+from tictactoe_pb2 import MessageType
+from framing import append_to_frames, encode_varint
+import message_cache
+import mnk
+from ratings import MAX_PLAYER_ID
+
+MAX_BOARDS = 64  # boards open at once on one connection
+GAME_ID_FIELD = 9
+VARINT = 0
+
+
+def game_id_field(game_id):
+    return encode_varint(GAME_ID_FIELD << 3 | VARINT) + encode_varint(game_id)
+
+
+class BoardChannel:
+    """One board of a multiplexed connection; to its game it looks like a player's connection."""
+
+    def __init__(self, mux, game_id, variant, player_id):
+        self.mux = mux
+        self.game_id = game_id
+        self.variant = variant
+        self.player_id = player_id
+        self.tag = game_id_field(game_id)
+        self.lock = threading.Lock()
+        self.game = None
+        self.player = None
+        self.finished = False
+
+    def send(self, data):
+        return self.mux.send(append_to_frames(data, self.tag))
+
+    def attach(self, game, player):
+        """Seat the board in the game it was matched into; True if it already left.
+
+        Done before the game's first message goes out, so the reader never gets a
+        move for a board that has no game yet. A board that left must then quit().
+        """
+        with self.lock:
+            self.game = game
+            self.player = player
+            return self.finished
+
+    def leave(self):
+        """Give up the board; its game ends for the opponent too."""
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+            game, player = self.game, self.player
+        self.mux.forget(self)
+        if game is None:
+            self.mux.server.unqueue_board(self)
+        else:
+            self.quit(game, player)
+
+    @staticmethod
+    def quit(game, player):
+        with game.lock:
+            game.departed.add(player)
+        game.player_dropped(player)
+        game.end_game()
+
+    def shutdown(self, how):
+        self.close()
+
+    def close(self):
+        """The game closed this board (its opponent is gone); the connection stays open."""
+        with self.lock:
+            self.finished = True
+        self.mux.forget(self)
+
+
+class Multiplexer:
+    """The boards of one multiplexed connection, keyed by game_id."""
+
+    def __init__(self, server, conn):
+        self.server = server
+        self.conn = conn
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()  # games on other threads share the connection
+        self.boards = {}
+        self.closed = False
+
+    def send(self, data):
+        with self.send_lock:
+            return self.conn.send(data)
+
+    def open_board(self, game_id, variant, player_id):
+        with self.lock:
+            refused = (self.closed or game_id == 0 or game_id in self.boards
+                       or len(self.boards) >= MAX_BOARDS)
+            if not refused:
+                channel = BoardChannel(self, game_id, variant, player_id)
+                self.boards[game_id] = channel
+        if refused:
+            self.send(append_to_frames(message_cache.BOARD_REFUSED[1], game_id_field(game_id)))
+            return
+        self.server.queue_board(channel)
+
+    def forget(self, channel):
+        with self.lock:
+            if self.boards.get(channel.game_id) is channel:
+                del self.boards[channel.game_id]
+
+    def dispatch(self, msg):
+        """Hand one incoming message to the game its board is playing."""
+        if msg.type == MessageType.START:
+            try:
+                variant = mnk.parse_variant(msg.variant)
+            except ValueError:
+                self.send(append_to_frames(message_cache.UNSUPPORTED_VARIANT[1],
+                                           game_id_field(msg.game_id)))
+                return
+            self.open_board(msg.game_id, variant,
+                            msg.player_id[:MAX_PLAYER_ID] or self.conn.player_id)
+            return
+        with self.lock:
+            channel = self.boards.get(msg.game_id)
+        if channel is None:
+            return
+        if msg.type == MessageType.LEAVE:
+            channel.leave()
+            return
+        game = channel.game
+        if game is None:
+            return  # still waiting for an opponent
+        with game.lock:
+            game.handle_message(msg, channel, game.connections[game.opponent(channel.player)],
+                                channel.player)
+            game.flush_chat()
+
+    def close(self):
+        """The connection is gone: give up every board on it."""
+        with self.lock:
+            self.closed = True
+            channels = list(self.boards.values())
+        for channel in channels:
+            channel.leave()
+        self.conn.close()
+        logging.info(f"Multiplexed connection closed with {len(channels)} boards open",
+                     extra={'sid': 'server'})
@@ -0,0 +1,54 @@
+"""Elo ratings for matchmaking.
+
+Clients may send a player_id with their VERSION_CHECK. Players with an id are
+matched by rating, and a game between two of them moves both ratings when it
+ends with a win or a draw. Players without one (and bots, and players handed
+over from another worker) all sit at DEFAULT_RATING and play unrated.
+
+Ratings live in memory, one book per server process. Ids are not
+authenticated: they only steer matchmaking, they are not a ranking.
+"""
+import threading
+
+DEFAULT_RATING = 1500.0
+K_FACTOR = 32.0  # most a rating can move in one game
+MAX_PLAYERS = 100000  # ids remembered; the oldest is forgotten first
+MAX_PLAYER_ID = 64  # characters of a player_id that are kept
+
+
+def expected_score(rating, opponent_rating):
+    """Chance of winning (a draw counting half) by the Elo formula."""
+    return 1.0 / (1.0 + 10.0 ** ((opponent_rating - rating) / 400.0))
+
+
+class RatingBook:
+    """Ratings by player_id; updated from game threads, so guarded by a lock."""
+
+    def __init__(self, max_players=MAX_PLAYERS):
+        self.lock = threading.Lock()
+        self.ratings = {}  # player_id -> rating, least recently rated first
+        self.max_players = max_players
+
+    def rating(self, player_id):
+        if not player_id:
+            return DEFAULT_RATING
+        with self.lock:
+            return self.ratings.get(player_id, DEFAULT_RATING)
+
+    def record_game(self, winner_id, loser_id, draw=False):
+        """Update both ratings after a game; does nothing unless both players have distinct ids.
+
+        For a draw, which player is the "winner" does not matter. Returns the new ratings.
+        """
+        if not winner_id or not loser_id or winner_id == loser_id:
+            return None
+        score = 0.5 if draw else 1.0
+        with self.lock:
+            winner_rating = self.ratings.pop(winner_id, DEFAULT_RATING)
+            loser_rating = self.ratings.pop(loser_id, DEFAULT_RATING)
+            change = K_FACTOR * (score - expected_score(winner_rating, loser_rating))
+            self.ratings[winner_id] = winner_rating + change
+            self.ratings[loser_id] = loser_rating - change
+            while len(self.ratings) > self.max_players:
+                del self.ratings[next(iter(self.ratings))]
+            return self.ratings[winner_id], self.ratings[loser_id]
@@ -3,26 +3,164 @@ import random
 import logging
 import time
 import ssl
+import errno
 import uuid
 import signal
 import sys
 import os
+import argparse
+import threading
+import selectors
+import secrets
+import contextlib
 from collections import deque
 from concurrent.futures import ThreadPoolExecutor
-import select
-from tictactoe_pb2 import TicTacToeMessage, MessageType, PlayerType, PlayerShape
+from tictactoe_pb2 import MessageType, PlayerType, PlayerShape
+from framing import MessageDecoder
+from matchmaking import PlayerQueue, GameSlots, MATCH_INTERVAL
+from ratings import RatingBook, MAX_PLAYER_ID
+from spectators import SpectatorFeed, QueuedWatcher
+from multiplex import Multiplexer, BoardChannel
+import mnk
+from bots import BotConnection, Scheduler
+from solver import MoveTable, DIFFICULTIES, TABLE_FILE
+from metrics import METRICS, serve_metrics
+from sessions import SessionStore, SuspendedConnection, SWEEP_INTERVAL
+from game_log import GameRecorder
+import message_cache
+import log_pipeline
+
+RECV_SIZE = 4096
+TLS_CIPHERS = "ECDHE+AESGCM"  # TLS 1.2 only; TLS 1.3 suites are always AEAD
+TLS_TICKETS = 2  # session tickets issued per TLS 1.3 handshake
+CHAT_RATE = 1.0  # chat messages per second a player can keep up
+CHAT_BURST = 5
+MAX_CHAT_LENGTH = 200
+
+
+def peer_gone(error):
+    """True for send errors that only mean the player has already disconnected."""
+    return (isinstance(error, (ConnectionError, ssl.SSLEOFError, ssl.SSLZeroReturnError))
+            or error.errno in (errno.ENOTCONN, errno.EBADF))
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s:%(levelname)s:%(sid)s:%(message)s")
 
+class ClientConnection:
+    """A player's socket together with the decoder for its incoming message stream."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.decoder = MessageDecoder()
+        self.variant = mnk.CLASSIC  # the board asked for in the version check
+        self.player_id = ""  # sent with the version check by clients that want ratings
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def send(self, data):
+        self.sock.sendall(data)
+        return len(data)
+
+    def shutdown(self, how):
+        # Not SSLSocket.shutdown, which drops the TLS layer: a thread blocked reading
+        # would then go on to read the raw records. This way it just sees EOF.
+        socket.socket.shutdown(self.sock, how)
+
+    def _fill(self, deadline=None):
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("Deadline expired while waiting for a message")
+            self.sock.settimeout(remaining)
+        data = self.sock.recv(RECV_SIZE)
+        METRICS.bytes_received.inc(len(data))
+        self.decoder.feed(data)
+        return bool(data)
+
+    def read_available(self):
+        """Buffer whatever a non-blocking socket has ready; False means the peer is gone."""
+        try:
+            return self._fill()
+        except (ssl.SSLWantReadError, BlockingIOError):
+            return True
+        except OSError:
+            return False
+
+    def read_message(self, deadline=None):
+        """Block until the next message arrives; None means the peer closed the connection.
+
+        With a deadline (a time.monotonic() value) socket.timeout is raised once it passes,
+        however slowly the peer trickles in bytes.
+        """
+        while True:
+            msg = self.decoder.next_message()
+            if msg is not None or not self._fill(deadline):
+                return msg
+
+    def read_messages(self):
+        """Block until at least one complete message arrives and return all buffered ones.
+
+        An empty list means the peer closed the connection.
+        """
+        while True:
+            messages = self.decoder.messages()
+            if messages or not self._fill():
+                return messages
+
+
+class HandshakeStats:
+    """Running totals for TLS handshakes, split into time spent queued and time spent handshaking.
+
+    resumed counts the handshakes that reused a session ticket or cached session, which
+    skip the certificate exchange and key agreement of a full handshake.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.resumed = 0
+        self.failed = 0
+        self.queue_seconds = 0.0
+        self.handshake_seconds = 0.0
+
+    def record(self, queue_seconds, handshake_seconds, resumed=False):
+        with self.lock:
+            self.queue_seconds += queue_seconds
+            self.handshake_seconds += handshake_seconds
+        self.record_completion(resumed)
+
+    def record_completion(self, resumed):
+        """Count a finished handshake whose timing is not known (asyncio does its own)."""
+        with self.lock:
+            self.completed += 1
+            self.resumed += resumed
+        METRICS.tls_handshakes.inc(label_value="resumed" if resumed else "full")
+
+    def record_failure(self):
+        with self.lock:
+            self.failed += 1
+
+
 class TicTacToeGame:
-    def __init__(self, server_reference, sid):
+    def __init__(self, server_reference, sid, variant=mnk.CLASSIC):
         self.server = server_reference
         self.sid = sid
-        self.server.increment_active_games()
+        self.variant = variant
+        self.lock = threading.Lock()
         self.is_decremented = False
-        self.board = [None] * 9
+        self.board = mnk.new_board(variant)
         self.reset_requests = set()
+        self.connections = {}
+        self.resume_tokens = {}
+        self.player_ids = {}
+        self.departed = set()
+        self.chat_allowance = {}  # player -> (tokens, last refill time)
+        self.chat_outbox = {}  # conn -> chat frames waiting for the next write to it
+        self.spectators = SpectatorFeed(sid, server_reference.spectator_slots.release,
+                                        server_reference.sessions.watched)
         self.current_turn = PlayerType.UNKNOWN_PLAYER
+        self.first_turn = PlayerType.UNKNOWN_PLAYER
+        self.moves = []  # squares played in the current game, for the game log
         self.player_shapes = {
             PlayerType.PLAYER_1: PlayerShape.UNKNOWN_SHAPE,
             PlayerType.PLAYER_2: PlayerShape.UNKNOWN_SHAPE,
@@ -30,220 +168,820 @@ class TicTacToeGame:
         self.reset_game()
 
     def reset_game(self):
+        self.record_game()
         self.current_turn = random.choice([PlayerType.PLAYER_1, PlayerType.PLAYER_2])
+        self.first_turn = self.current_turn
         player1_shape = random.choice([PlayerShape.X, PlayerShape.O])
         player2_shape = PlayerShape.O if player1_shape == PlayerShape.X else PlayerShape.X
         self.player_shapes = {
             PlayerType.PLAYER_1: player1_shape,
             PlayerType.PLAYER_2: player2_shape,
         }
-        self.board = [None] * 9
+        self.board = mnk.new_board(self.variant)
         self.reset_requests = set()
 
+    def record_game(self):
+        """Hand the current game to the game log once, if any move was played."""
+        if self.moves and self.server.recorder is not None:
+            self.server.recorder.record(self.sid, self.variant,
+                                        self.player_shapes[PlayerType.PLAYER_1],
+                                        self.first_turn, self.board.status(), self.moves)
+        self.moves = []
+
+    def rate_game(self, mover):
+        """Update the players' ratings once the mover has won or drawn the game."""
+        ratings = self.server.ratings.record_game(self.player_ids[mover],
+                                                  self.player_ids[self.opponent(mover)],
+                                                  draw=self.board.winner() is None)
+        if ratings is not None:
+            logging.debug("Ratings now %.0f for player %s and %.0f for the other",
+                          ratings[0], mover, ratings[1], extra={'sid': self.sid})
+
+    @staticmethod
+    def opponent(player):
+        return PlayerType.PLAYER_2 if player == PlayerType.PLAYER_1 else PlayerType.PLAYER_1
+
     def send_message(self, conn, **attributes):
+        self.send_messages(conn, attributes)
+
+    def send_messages(self, conn, *messages):
+        """Send several messages, given as attribute dicts, to one player with a single write."""
+        self.send_frames(conn, *(message_cache.encode(**attributes) for attributes in messages))
+
+    def send_frames(self, conn, *frames):
+        """Send already encoded frames (see message_cache) to one player with a single write.
+
+        Chat queued for the player goes out first, in the same write.
+        """
+        queued_chat = self.chat_outbox.pop(conn, None)
+        if queued_chat:
+            frames = (*queued_chat, *frames)
         try:
-            msg = TicTacToeMessage(**attributes)
-            conn.send(msg.SerializeToString())
-        except (BrokenPipeError, ConnectionResetError, OSError) as e:
-            logging.error(f"Failed to send message: {e}", extra={'sid': self.sid})
+            data = b"".join(frame for _, frame in frames)
+            conn.send(data)
+            METRICS.bytes_sent.inc(len(data))
+            for type_name, _ in frames:
+                METRICS.messages_sent.inc(label_value=type_name)
+        except OSError as e:
+            logging.log(logging.INFO if peer_gone(e) else logging.ERROR,
+                        f"Failed to send message: {e}", extra={'sid': self.sid})
+
+    def allow_chat(self, player, message):
+        """Token bucket per player; oversized or excess chat is dropped and counted."""
+        if len(message) > MAX_CHAT_LENGTH:
+            METRICS.chat_dropped.inc(label_value="too_long")
+            return False
+        now = time.monotonic()
+        tokens, refilled_at = self.chat_allowance.get(player, (CHAT_BURST, now))
+        tokens = min(CHAT_BURST, tokens + (now - refilled_at) * CHAT_RATE)
+        if tokens < 1:
+            self.chat_allowance[player] = (tokens, now)
+            METRICS.chat_dropped.inc(label_value="throttled")
+            return False
+        self.chat_allowance[player] = (tokens - 1, now)
+        return True
+
+    def relay_chat(self, message, player, other_conn):
+        """Queue chat for the opponent; flush_chat or their next message sends it."""
+        self.chat_outbox.setdefault(other_conn, []).append(
+            message_cache.encode(type=MessageType.CHAT, content=f"Opponent: {message}"))
+        if self.spectators:
+            shape = PlayerShape.Name(self.player_shapes[player])
+            self.spectators.broadcast(
+                message_cache.encode(type=MessageType.CHAT, content=f"{shape}: {message}"))
+
+    def flush_chat(self):
+        """Send all queued chat, one write per recipient. The caller holds the game lock."""
+        for conn in list(self.chat_outbox):
+            self.send_frames(conn)
 
-    def relay_chat(self, message, other_conn):
-        self.send_message(other_conn, type=MessageType.CHAT, content=f"Opponent: {message}")
+    def reset_confirmation(self, player):
+        return message_cache.reset_confirmation(self.current_turn == player,
+                                                self.player_shapes[player])
 
     def process_reset_request(self, conn1, conn2):
         self.reset_game()
-        player1_data = {
-            "type": MessageType.RESET_CONFIRMATION,
-            "is_your_turn": self.current_turn == PlayerType.PLAYER_1,
-            "player_shape": self.player_shapes[PlayerType.PLAYER_1],
-        }
-        player2_data = {
-            "type": MessageType.RESET_CONFIRMATION,
-            "is_your_turn": self.current_turn == PlayerType.PLAYER_2,
-            "player_shape": self.player_shapes[PlayerType.PLAYER_2],
-        }
-        self.send_message(conn1, **player1_data)
-        self.send_message(conn2, **player2_data)
+        self.send_frames(conn1, self.reset_confirmation(PlayerType.PLAYER_1))
+        self.send_frames(conn2, self.reset_confirmation(PlayerType.PLAYER_2))
+        if self.spectators:
+            self.spectators.broadcast(self.spectator_snapshot())
 
     def win_check(self) -> int:
-        win_conditions = [
-            [0, 1, 2], [3, 4, 5], [6, 7, 8],  # Horizontal
-            [0, 3, 6], [1, 4, 7], [2, 5, 8],  # Vertical
-            [0, 4, 8], [2, 4, 6]              # Diagonal
-        ]
-        for idx, c in enumerate(win_conditions):
-            if self.board[c[0]] and self.board[c[0]] == self.board[c[1]] == self.board[c[2]]:
-                return idx + 1
-        if None in self.board:
-            return 0
-        else:
-            return 9
-
-    def handle_client(self, conn, other_conn, player):
+        return self.board.status()
+
+    def board_squares(self):
+        """The board row by row, one character per square: X, O or -."""
+        rows, columns, _ = self.variant
+        return "".join({PlayerShape.X: "X", PlayerShape.O: "O"}.get(self.board[square], "-")
+                       for square in range(rows * columns))
+
+    def snapshot(self, player):
+        """SNAPSHOT message describing the whole game to a player who rejoined."""
+        return {
+            "type": MessageType.SNAPSHOT,
+            "content": self.board_squares(),
+            "variant": mnk.variant_name(self.variant),
+            "player": player,
+            "player_shape": self.player_shapes[player],
+            "is_your_turn": self.current_turn == player,
+            "win_type": self.win_check(),
+        }
+
+    def spectator_snapshot(self):
+        """SNAPSHOT frame for spectators; player and player_shape say whose turn it is."""
+        return message_cache.encode(
+            type=MessageType.SNAPSHOT, content=self.board_squares(),
+            variant=mnk.variant_name(self.variant), player=self.current_turn,
+            player_shape=self.player_shapes.get(self.current_turn, PlayerShape.UNKNOWN_SHAPE),
+            win_type=self.win_check())
+
+    def handle_message(self, msg, conn, other_conn, player):
+        METRICS.messages_received.inc(label_value=MessageType.Name(msg.type))
+        if msg.type == MessageType.CHAT:
+            logging.debug("Player %s sent a chat message", player,
+                          extra={'sid': self.sid, 'event': 'chat'})
+            if self.allow_chat(player, msg.content):
+                self.relay_chat(msg.content, player, other_conn)
+        elif msg.type == MessageType.LEAVE:
+            self.departed.add(player)
+        elif msg.type == MessageType.RESET_REQUEST:
+            self.reset_requests.add(player)
+            if len(self.reset_requests) == 2:
+                if player == PlayerType.PLAYER_1:
+                    self.process_reset_request(conn, other_conn)
+                else:
+                    self.process_reset_request(other_conn, conn)
+            else:
+                self.send_frames(other_conn, message_cache.PLAY_AGAIN)
+        elif msg.type == MessageType.MOVE and player == self.current_turn:
+            started_at = time.perf_counter()
+            square = int(msg.content)
+            logging.debug("Player %s played square %s", player, square,
+                          extra={'sid': self.sid, 'event': 'move'})
+            if self.board.is_free(square):
+                game_status = self.board.place(square, self.player_shapes[player])
+                self.moves.append(square)
+                if game_status == 0:
+                    if player == PlayerType.PLAYER_1:
+                        self.current_turn = PlayerType.PLAYER_2
+                    else:
+                        self.current_turn = PlayerType.PLAYER_1
+                else:
+                    self.current_turn = PlayerType.UNKNOWN_PLAYER
+
+                move = square, self.player_shapes[player], self.current_turn, game_status
+                other_frame, own_frame = message_cache.move_frames(*move)
+                self.send_frames(other_conn, other_frame)
+                self.send_frames(conn, own_frame)
+                if self.spectators:
+                    self.spectators.broadcast(message_cache.spectated_move(*move))
+                if game_status != 0:
+                    self.rate_game(player)
+                    self.record_game()
+            METRICS.move_seconds.observe(time.perf_counter() - started_at)
+
+    def handle_disconnect(self, other_conn, notify=True):
+        """End the game for the opponent; notify is False when they have left as well.
+
+        The opponent's socket is only shut down: its reader may still be blocked on it,
+        and closes it once it wakes (see handle_client).
+        """
+        try:
+            if notify:
+                self.send_frames(other_conn, message_cache.OPPONENT_DISCONNECTED)
+            other_conn.shutdown(socket.SHUT_RDWR)
+        except OSError as ex:
+            if not peer_gone(ex):
+                logging.error(f"Error while handling disconnection: {ex}",
+                              extra={'sid': self.sid})
+        except Exception as ex:
+            logging.error(f"Error while handling disconnection: {ex}",
+                          extra={'sid': self.sid})
+
+    def player_dropped(self, player):
+        """Hold the game for a player whose connection was lost, or end it for the opponent.
+
+        A player who sent LEAVE is not held. Returns True while the game is being held.
+        """
+        with self.lock:
+            held = player not in self.departed and self.server.sessions.suspend(self, player)
+            if held:
+                self.connections[player] = SuspendedConnection()
+            other_conn = self.connections[self.opponent(player)]
+            other_left = self.opponent(player) in self.departed
+        if not held:
+            self.handle_disconnect(other_conn, notify=not other_left)
+            return False
+        grace = self.server.sessions.grace
+        self.send_message(other_conn, type=MessageType.MESSAGE,
+                          content=f"Opponent lost connection, waiting {grace:g} s for them")
+        logging.info(f"Holding the game {grace:g} s for player {player}", extra={'sid': self.sid})
+        return True
+
+    def end_game(self):
+        with self.lock:
+            if self.is_decremented:
+                return
+            self.is_decremented = True
+            self.record_game()
+            self.spectators.close(message_cache.GAME_OVER)
+        self.server.sessions.remove(self.sid)
+        self.server.decrement_active_games()
+
+    def handle_client(self, conn, player):
+        opponent = self.opponent(player)
+        held = False
         try:
             while True:
-                data = conn.recv(1024)
-                if not data:
+                messages = conn.read_messages()
+                if not messages:
                     raise ConnectionError(f"Player {player} has disconnected.")
-                msg = TicTacToeMessage()
-                msg.ParseFromString(data)
-                if msg.type == MessageType.CHAT:
-                    self.relay_chat(msg.content, other_conn)
-                elif msg.type == MessageType.RESET_REQUEST:
-                    self.reset_requests.add(player)
-                    if len(self.reset_requests) == 2:
-                        if player == PlayerType.PLAYER_1:
-                            self.process_reset_request(conn, other_conn)
-                        else:
-                            self.process_reset_request(other_conn, conn)
-                    else:
-                        self.send_message(other_conn, type=MessageType.PLAY_AGAIN)
-                elif msg.type == MessageType.MOVE and player == self.current_turn:
-                    if self.board[int(msg.content)] is None:
-                        self.board[int(msg.content)] = self.player_shapes[player]
-                        game_status = self.win_check()
-                        if game_status == 0:
-                            if player == PlayerType.PLAYER_1:
-                                self.current_turn = PlayerType.PLAYER_2
-                            else:
-                                self.current_turn = PlayerType.PLAYER_1
-                        else:
-                            self.current_turn = PlayerType.UNKNOWN_PLAYER
-
-                        move_msg_attrs = {
-                            "type": MessageType.MOVE,
-                            "content": str(msg.content),
-                            "player": self.current_turn,
-                            "win_type": game_status,
-                            "is_your_turn": game_status == 0,
-                            "player_shape": self.player_shapes[player],
-                        }
-                        self.send_message(other_conn, **move_msg_attrs)
-                        move_msg_attrs["is_your_turn"] = not move_msg_attrs["is_your_turn"]
-                        self.send_message(conn, **move_msg_attrs)
-        except ConnectionError as e:
-            logging.info(str(e), extra={'sid': self.sid})
-            disconnect_msg = "Opponent has disconnected"
-            try:
-                self.send_message(other_conn, type=MessageType.MESSAGE, content=disconnect_msg)
-                other_conn.shutdown(socket.SHUT_RDWR)
-                other_conn.close()
-            except Exception as ex:
-                logging.error(f"Error while handling disconnection: {ex}", 
-                              extra={'sid': self.sid})
+                with self.lock:
+                    for msg in messages:
+                        self.handle_message(msg, conn, self.connections[opponent], player)
+                    self.flush_chat()
+        except OSError as e:
+            logging.info(str(e) or f"Player {player} lost connection.", extra={'sid': self.sid})
+            held = self.player_dropped(player)
         except Exception as e:
             logging.error(f"Unexpected error with client: {e}", extra={'sid': self.sid})
         finally:
-            if not self.is_decremented:
-                self.server.decrement_active_games()
-                self.is_decremented = True
+            # Closed here, not by the opponent's thread: a socket closed under a blocked
+            # read can steal bytes from the next connection to get its descriptor.
+            conn.close()
+            if not held:
+                self.end_game()
 
 
 class TicTacToeServer:
-    def __init__(self):
-        self.active_games = 0
-        self.max_games = 10
-        self.version = "1.0.0"
+    def __init__(self, max_games=10, bot_after=None, bot_difficulty="Hard", metrics_port=None,
+                 resume_grace=30.0, max_spectators=1000, record_dir=None, max_multiplexed=100):
+        self.game_slots = GameSlots(max_games)
+        self.spectator_slots = GameSlots(max_spectators)
+        self.multiplexed_slots = GameSlots(max_multiplexed)
+        self.sessions = SessionStore(resume_grace, max_suspended=max_games)
+        self.version = "1.1.0"
         self.running = True
+        self.handshake_workers = 16
+        self.handshake_timeout = 10.0
+        self.version_check_workers = 64
+        self.version_check_timeout = 5.0
+        self.handshake_stats = HandshakeStats()
+        self.reuse_port = False
+        self.player_queue = PlayerQueue()
+        self.ratings = RatingBook()
+        self.has_logged_max_capacity = False
+        self.pending_calls = deque()
+        self.spectator_readers = {}  # QueuedWatcher -> whether its writer has stopped
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.scheduler = Scheduler()
+        self.bot_after = bot_after
+        self.bot_skill = DIFFICULTIES[bot_difficulty]
+        self.move_table = None
+        if bot_after is not None:
+            table_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), TABLE_FILE)
+            self.move_table = MoveTable.load(table_path)
+        self.metrics_port = metrics_port
+        self.recorder = GameRecorder(record_dir) if record_dir else None
         self.logger = logging.getLogger()
 
     def set_log_level(self, level):
-        if level.lower() == 'info':
-            self.logger.setLevel(logging.INFO)
-            print("Log level has been set to INFO")
-        elif level.lower() == 'error':
-            self.logger.setLevel(logging.ERROR)
-            print("Log level has been set to ERROR")
-        elif level.lower() == 'off':
-            self.logger.setLevel(logging.CRITICAL)
-            print("Logging has been disabled")
-        else:
-            print("Invalid log level. Available options are 'info', 'error', and 'off'.")
-
-    def increment_active_games(self):
-        self.active_games += 1
+        log_pipeline.set_log_level(level)
 
-    def decrement_active_games(self):
-        self.active_games -= 1
+    @property
+    def active_games(self):
+        return self.game_slots.active
 
-    def start(self):
-        logging.info("Starting Server...", extra={'sid': 'server'})
-        player_queue = deque()
-        has_logged_max_capacity = False
+    @property
+    def max_games(self):
+        return self.game_slots.limit
 
-        context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+    def decrement_active_games(self):
+        self.game_slots.release()
+
+    def create_ssl_context(self):
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
         context.check_hostname = False
         context.verify_mode = ssl.CERT_NONE
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.set_ciphers(TLS_CIPHERS)
+        # Returning clients resume with a session ticket (or a cached TLS 1.2 session) instead
+        # of a full handshake. Tickets are only valid for this context, so it must be built once.
+        context.options &= ~ssl.OP_NO_TICKET
+        context.num_tickets = TLS_TICKETS
         context.load_cert_chain(certfile='combined_cert.pem', keyfile='private_key.pem')
+        return context
 
-        with ThreadPoolExecutor(max_workers=self.max_games * 2) as executor, \
-            socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+    def version_response(self, msg):
+        """Frame of the VERSION_CHECK reply for a client's first message, or None to reject it.
 
-            server_socket = context.wrap_socket(server_socket, server_side=True)
-            server_socket.bind(("0.0.0.0", 52423))
-            server_socket.listen(5)
+        Spectators open with SPECTATE instead, which carries the version the same way.
+        """
+        if msg.type not in (MessageType.VERSION_CHECK, MessageType.SPECTATE):
+            return None
+        if msg.version != self.version:
+            logging.info(f"Rejecting client with version {msg.version}",
+                         extra={'sid': 'server'})
+            return message_cache.VERSION_INVALID
+        return message_cache.VERSION_VALID
 
-            while True:
-                if self.active_games >= self.max_games:
-                    if not has_logged_max_capacity:
-                        logging.info("Server at maximum capacity!", extra={'sid': 'server'})
-                        has_logged_max_capacity = True
-                    time.sleep(0.1)
-                    continue
-                else:
-                    has_logged_max_capacity = False
-
-                try:
-                    conn, _ = server_socket.accept()
-                    data = conn.recv(1024)
-                    msg = TicTacToeMessage()
-                    msg.ParseFromString(data)
-                    if msg.type == MessageType.VERSION_CHECK:
-                        client_version = msg.version
-                        response_msg = TicTacToeMessage(type=MessageType.VERSION_CHECK)
-                        if client_version != self.version:
-                            logging.info(f"Rejecting client with version {client_version}",
-                                         extra={'sid': 'server'})
-                            response_msg.content = "INVALID"
-                            conn.send(response_msg.SerializeToString())
-                            conn.close()
-                            continue
-                        else:
-                            response_msg.content = "VALID"
-                            conn.send(response_msg.SerializeToString())
-                except Exception as e:
-                    logging.error(f"Failed to perform version check: {e}", extra={'sid': 'server'})
+    def answer_version_check(self, conn, msg):
+        """Reply to a client's first message; returns False if the client is turned away.
+
+        The board variant and the player_id the client sent are stored on conn.
+        """
+        METRICS.messages_received.inc(label_value=MessageType.Name(msg.type))
+        response = self.version_response(msg)
+        if response is not None:
+            type_name, data = response
+            conn.send(data)
+            METRICS.bytes_sent.inc(len(data))
+            METRICS.messages_sent.inc(label_value=type_name)
+            if response is message_cache.VERSION_INVALID:
+                METRICS.rejected.inc(label_value="version_mismatch")
+                return False
+            try:
+                conn.variant = mnk.parse_variant(msg.variant)
+            except ValueError:
+                conn.send(message_cache.UNSUPPORTED_VARIANT[1])
+                METRICS.rejected.inc(label_value="variant")
+                return False
+            conn.player_id = msg.player_id[:MAX_PLAYER_ID]
+        METRICS.accepted.inc()
+        return True
+
+    def start_recorder(self):
+        if self.recorder is not None:
+            self.recorder.start()
+            logging.info(f"Recording games to {self.recorder.directory}",
+                         extra={'sid': 'server'})
+
+    def start_metrics(self):
+        """Serve /metrics on metrics_port, if one was given."""
+        if self.metrics_port is None:
+            return
+        METRICS.add_gauge("tictactoe_active_games", "Games in progress",
+                          lambda: self.active_games)
+        METRICS.add_gauge("tictactoe_max_games", "Limit on concurrent games",
+                          lambda: self.max_games)
+        METRICS.add_gauge("tictactoe_waiting_players", "Players queued for an opponent",
+                          lambda: len(self.player_queue))
+        METRICS.add_gauge("tictactoe_spectators", "Spectators watching a game",
+                          lambda: self.spectator_slots.active)
+        METRICS.add_gauge("tictactoe_multiplexed_connections", "Open multiplexed connections",
+                          lambda: self.multiplexed_slots.active)
+        METRICS.add_gauge("tictactoe_time_to_match_median_seconds",
+                          "Median time to match of recently matched players",
+                          self.player_queue.median_wait)
+        serve_metrics(self.metrics_port)
+
+    def create_game(self, player1_conn, player2_conn):
+        new_session_id = str(uuid.uuid4())[:8]
+        logging.info(f"Created session {new_session_id}", extra={'sid': 'server'})
+        game_instance = TicTacToeGame(self, new_session_id, player1_conn.variant)
+        for conn, player in ((player1_conn, PlayerType.PLAYER_1),
+                             (player2_conn, PlayerType.PLAYER_2)):
+            game_instance.connections[player] = conn
+            game_instance.resume_tokens[player] = secrets.token_hex(16)
+            game_instance.player_ids[player] = conn.player_id
+        self.sessions.add(game_instance)
+        # A board's reader hands its moves to the game as soon as it is attached, so both
+        # players get their START under the game lock before any move is played.
+        with game_instance.lock:
+            abandoned = [(conn, player) for player, conn in game_instance.connections.items()
+                         if isinstance(conn, BoardChannel) and conn.attach(game_instance, player)]
+            for player, conn in game_instance.connections.items():
+                start = message_cache.start_frame(new_session_id, player,
+                                                  game_instance.resume_tokens[player],
+                                                  mnk.variant_name(game_instance.variant))
+                game_instance.send_frames(conn, start, game_instance.reset_confirmation(player))
+        for conn, player in abandoned:
+            conn.quit(game_instance, player)
+        return game_instance
+
+    def resume_game(self, conn, msg):
+        """Seat a player who reconnected with their session id and resume token.
+
+        Returns the game, or None if it is no longer held. The player is then told that
+        it is being matched afresh, and the caller queues it as a new player.
+        """
+        game_instance = self.sessions.reattach(msg.content, msg.player, msg.resume_token)
+        if game_instance is None:
+            METRICS.rejoins.inc(label_value="expired")
+            conn.send(message_cache.GAME_ENDED[1])
+            return None
+        METRICS.rejoins.inc(label_value="resumed")
+        with game_instance.lock:
+            game_instance.connections[msg.player] = conn
+            game_instance.send_messages(conn, game_instance.snapshot(msg.player))
+            other_conn = game_instance.connections[game_instance.opponent(msg.player)]
+            game_instance.send_frames(other_conn, message_cache.OPPONENT_RECONNECTED)
+        logging.info(f"Player {msg.player} rejoined", extra={'sid': game_instance.sid})
+        return game_instance
+
+    def add_spectator(self, conn, sid, watcher):
+        """Subscribe watcher to the game with this sid (any game if empty).
+
+        Returns the game, or None after telling the spectator why not.
+        """
+        game_instance = self.sessions.watchable(sid)
+        if game_instance is None:
+            conn.send(message_cache.NOTHING_TO_WATCH[1])
+            return None
+        if not self.spectator_slots.try_acquire():
+            conn.send(message_cache.TOO_MANY_SPECTATORS[1])
+            return None
+        with game_instance.lock:
+            if game_instance.is_decremented:
+                self.spectator_slots.release()
+                conn.send(message_cache.NOTHING_TO_WATCH[1])
+                return None
+            game_instance.spectators.add(watcher, game_instance.spectator_snapshot())
+        logging.info(f"Spectator joined, {len(game_instance.spectators)} watching",
+                     extra={'sid': game_instance.sid, 'event': 'watch'})
+        return game_instance
+
+    def sweep_sessions(self):
+        """End the games whose dropped player did not come back in time; runs on a timer."""
+        for game_instance, player in self.sessions.pop_expired():
+            logging.info(f"Player {player} did not return", extra={'sid': game_instance.sid})
+            with game_instance.lock:
+                other_conn = game_instance.connections[game_instance.opponent(player)]
+            game_instance.handle_disconnect(other_conn)
+            game_instance.end_game()
+        self.call_later(SWEEP_INTERVAL, self.sweep_sessions)
+
+    def widen_rating_windows(self):
+        """Retry matching on a timer, since waiting players accept wider rating gaps over time."""
+        self.call_later(MATCH_INTERVAL, self.call_soon, self.widen_rating_windows)
+
+    def create_bot_game(self, conn):
+        bot = BotConnection(self)
+        game_instance = self.create_game(conn, bot)
+        bot.attach(game_instance, PlayerType.PLAYER_2)
+        logging.info(f"Paired a player with a bot after {self.bot_after:g} s",
+                     extra={'sid': game_instance.sid})
+        return game_instance
+
+    def call_later(self, delay, callback, *args):
+        """Run callback after delay seconds on the scheduler thread."""
+        return self.scheduler.call_later(delay, callback, *args)
+
+    def accept_connections(self, server_socket, context):
+        """Accept raw TCP connections and hand each one to the handshake pool."""
+        while self.running:
+            try:
+                sock, address = server_socket.accept()
+            except OSError as e:
+                if not self.running:
+                    break
+                logging.error(f"Failed to accept connection: {e}", extra={'sid': 'server'})
+                continue
+            self.handshake_pool.submit(self.tls_handshake, sock, address, context,
+                                       time.monotonic())
+
+    def tls_handshake(self, sock, address, context, accepted_at):
+        started_at = time.monotonic()
+        try:
+            sock.settimeout(self.handshake_timeout)
+            tls_sock = context.wrap_socket(sock, server_side=True)
+            tls_sock.settimeout(None)
+        except OSError as e:
+            self.handshake_stats.record_failure()
+            METRICS.rejected.inc(label_value="tls_handshake")
+            logging.info(f"TLS handshake with {address[0]} failed: {e}",
+                         extra={'sid': 'server', 'event': 'handshake'})
+            sock.close()
+            return
+        queue_seconds = started_at - accepted_at
+        handshake_seconds = time.monotonic() - started_at
+        resumed = tls_sock.session_reused
+        self.handshake_stats.record(queue_seconds, handshake_seconds, resumed)
+        logging.info(f"{'Resumed' if resumed else 'Full'} TLS handshake with {address[0]} took "
+                     f"{handshake_seconds * 1000:.1f} ms after {queue_seconds * 1000:.1f} ms queued",
+                     extra={'sid': 'server', 'event': 'handshake'})
+        self.version_pool.submit(self.check_version, ClientConnection(tls_sock))
+
+    def check_version(self, conn):
+        """Validate a client's VERSION_CHECK before the deadline and queue it for matchmaking."""
+        try:
+            msg = conn.read_message(time.monotonic() + self.version_check_timeout)
+            if msg is None:
+                raise ConnectionError("Client disconnected before the version check")
+            if not self.answer_version_check(conn, msg):
+                conn.close()
+                return
+            if msg.type == MessageType.SPECTATE:
+                conn.settimeout(None)
+                watcher = QueuedWatcher(conn)
+                watcher.on_exit = lambda: self.call_soon(self.forget_spectator, watcher)
+                game_instance = self.add_spectator(conn, msg.content, watcher)
+                if game_instance is None:
+                    conn.close()
+                    return
+                self.call_soon(self.watch_spectator, game_instance, watcher)
+                threading.Thread(target=watcher.run, daemon=True).start()
+                return
+            if msg.game_id:
+                if not self.admit_multiplexed(conn):
                     conn.close()
-                    continue
+                    return
+                conn.settimeout(None)
+                # A dedicated thread, so readers never take game_pool threads from games.
+                threading.Thread(target=self.serve_multiplexed, args=(conn, msg.game_id),
+                                 daemon=True).start()
+                return
+            if msg.content:
+                conn.settimeout(None)
+                game_instance = self.resume_game(conn, msg)
+                if game_instance is not None:
+                    self.game_pool.submit(game_instance.handle_client, conn, msg.player)
+                    return
+        except Exception as e:
+            METRICS.rejected.inc(label_value="version_check")
+            logging.error(f"Failed to perform version check: {e}", extra={'sid': 'server'})
+            conn.close()
+            return
+        self.call_soon(self.add_waiting_player, conn)
+
+    def admit_multiplexed(self, conn):
+        """Take a multiplexed connection slot; returns False, after telling the client, if full.
+
+        Multiplexed connections are capped apart from games: their readers hold no game slot.
+        """
+        if self.multiplexed_slots.try_acquire():
+            return True
+        conn.send(message_cache.TOO_MANY_MULTIPLEXED[1])
+        METRICS.rejected.inc(label_value="multiplexed")
+        return False
 
-                player_queue.append(conn)
+    @contextlib.contextmanager
+    def multiplexed(self, conn, game_id):
+        """Open a multiplexed connection's first board and give its reader the Multiplexer.
+
+        Whatever ends the reader is logged, and every board still open is given up.
+        """
+        mux = Multiplexer(self, conn)
+        mux.open_board(game_id, conn.variant, conn.player_id)
+        try:
+            yield mux
+        except OSError as e:
+            logging.info(f"Multiplexed connection lost: {e}", extra={'sid': 'server'})
+        except Exception as e:
+            logging.error(f"Unexpected error with multiplexed client: {e}",
+                          extra={'sid': 'server'})
+        finally:
+            mux.close()
+            self.multiplexed_slots.release()
 
-                for sock in list(player_queue):
+    def serve_multiplexed(self, conn, game_id):
+        """Read a multiplexed connection, handing each message to its board's game."""
+        with self.multiplexed(conn, game_id) as mux:
+            while True:
+                messages = conn.read_messages()
+                if not messages:
+                    break
+                for msg in messages:
+                    mux.dispatch(msg)
+
+    def queue_board(self, channel):
+        """Queue a new board of a multiplexed connection for an opponent."""
+        self.call_soon(self.add_waiting_player, channel)
+
+    def unqueue_board(self, channel):
+        self.call_soon(self.player_queue.remove, channel)
+
+    @staticmethod
+    def can_hand_off(conn):
+        """Only classic players on their own connection can move to another worker.
+
+        A handed off player is relayed as raw bytes, so its variant would not follow it.
+        """
+        return not isinstance(conn, BoardChannel) and conn.variant == mnk.CLASSIC
+
+    def seat_player(self, game_instance, conn, player):
+        """Start serving a matched player; a board is served by its connection's reader."""
+        if not isinstance(conn, BoardChannel):
+            self.game_pool.submit(game_instance.handle_client, conn, player)
+
+    def wake_matchmaker(self):
+        try:
+            self.wakeup_writer.send(b"\0")
+        except BlockingIOError:
+            pass
+
+    def call_soon(self, callback, *args):
+        """Run callback on the matchmaker thread, which owns player_queue."""
+        self.pending_calls.append((callback, args))
+        self.wake_matchmaker()
+
+    def add_waiting_player(self, conn):
+        if not isinstance(conn, BoardChannel):
+            conn.setblocking(False)
+            self.selector.register(conn.sock, selectors.EVENT_READ, conn)
+        if self.active_games >= self.max_games:
+            METRICS.capacity_waits.inc()
+        self.player_queue.add(conn, conn.variant, self.ratings.rating(conn.player_id))
+        if self.bot_after is not None and conn.variant == mnk.CLASSIC:
+            self.call_later(self.bot_after, self.call_soon, self.offer_bot, conn)
+
+    def check_waiting_player(self, conn):
+        """A waiting player's socket became readable; drop it from the queue if it closed."""
+        if not conn.read_available():
+            logging.info("Waiting player disconnected", extra={'sid': 'server'})
+            self.selector.unregister(conn.sock)
+            self.player_queue.remove(conn)
+            conn.close()
+
+    def watch_spectator(self, game_instance, watcher):
+        """Notice a spectator leaving the moment it happens, as for waiting players."""
+        self.selector.register(watcher.conn.sock, selectors.EVENT_READ, (game_instance, watcher))
+
+    def check_spectator(self, game_instance, watcher):
+        """A spectator's socket became readable: it left, or sent something.
+
+        It is read on a thread of its own from then on, so the selector never waits on
+        a partial TLS record.
+        """
+        self.selector.unregister(watcher.conn.sock)
+        self.spectator_readers[watcher] = False
+        threading.Thread(target=self.read_spectator, args=(game_instance, watcher),
+                         daemon=True).start()
+
+    def read_spectator(self, game_instance, watcher):
+        try:
+            while watcher.conn.read_messages():
+                pass  # spectators have nothing to say to the game
+        except (OSError, ValueError):
+            pass  # ValueError: forget_spectator shut the socket down under us
+        except Exception as e:
+            logging.error(f"Unexpected error with spectator: {e}", extra={'sid': game_instance.sid})
+        finally:
+            with game_instance.lock:
+                game_instance.spectators.remove(watcher)
+            self.call_soon(self.spectator_read, watcher)
+
+    def spectator_read(self, watcher):
+        if self.spectator_readers.pop(watcher):
+            watcher.conn.close()
+
+    def forget_spectator(self, watcher):
+        """A spectator's writer has stopped; close its socket once nothing reads it either.
+
+        Closing under a blocked read would let it steal bytes from whichever connection
+        is given the descriptor next, so a reader is woken with a shutdown instead and
+        the socket closed by spectator_read.
+        """
+        if watcher in self.spectator_readers:
+            self.spectator_readers[watcher] = True
+            try:
+                watcher.conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            return
+        try:
+            self.selector.unregister(watcher.conn.sock)
+        except KeyError:
+            pass  # its reader has already finished
+        watcher.conn.close()
+
+    def take_waiting_player(self, conn):
+        if isinstance(conn, BoardChannel):
+            return conn
+        self.selector.unregister(conn.sock)
+        conn.setblocking(True)
+        return conn
+
+    def offer_bot(self, conn):
+        """Give a player who waited past bot_after a bot opponent, if they are still waiting."""
+        if conn not in self.player_queue:
+            return
+        if not self.game_slots.try_acquire():
+            self.call_later(self.bot_after, self.call_soon, self.offer_bot, conn)
+            return
+        self.player_queue.remove(conn, matched=True)
+        game_instance = self.create_bot_game(self.take_waiting_player(conn))
+        self.seat_player(game_instance, conn, PlayerType.PLAYER_1)
+
+    def match_players(self):
+        """Pair waiting players for as long as find_pair has pairs and there are game slots."""
+        while True:
+            pair = self.player_queue.find_pair()
+            if pair is None:
+                return
+            if not self.game_slots.try_acquire():
+                if not self.has_logged_max_capacity:
+                    logging.info("Server at maximum capacity!", extra={'sid': 'server'})
+                    self.has_logged_max_capacity = True
+                return
+            self.has_logged_max_capacity = False
+            player1_conn, player2_conn = map(self.take_waiting_player,
+                                             self.player_queue.pop_pair(pair))
+            game_instance = self.create_game(player1_conn, player2_conn)
+            self.seat_player(game_instance, player1_conn, PlayerType.PLAYER_1)
+            self.seat_player(game_instance, player2_conn, PlayerType.PLAYER_2)
+
+    def hand_off_lone_player(self, send_socket):
+        """Give our only waiting player to another worker process.
+
+        The player's TLS session cannot leave this process, so its bytes are relayed
+        through a socketpair whose far end is passed to send_socket (None is passed if
+        there is no lone player any more). Boards of a multiplexed connection stay here.
+        """
+        if len(self.player_queue) != 1 or not self.can_hand_off(self.player_queue.peek_oldest()):
+            send_socket(None)
+            return
+        conn = self.take_waiting_player(self.player_queue.pop_oldest())
+        local_sock, remote_sock = socket.socketpair()
+        self.start_relay(conn, local_sock)
+        send_socket(remote_sock)
+
+    def start_relay(self, conn, sock):
+        threading.Thread(target=self.relay, args=(conn, sock), daemon=True).start()
+
+    def adopt_player(self, sock):
+        """Queue a player handed off by another worker; it already passed the version check."""
+        self.add_waiting_player(ClientConnection(sock))
+
+    def relay(self, conn, sock):
+        def pump(source, destination):
+            try:
+                while True:
+                    data = source.recv(RECV_SIZE)
+                    if not data:
+                        break
+                    destination.sendall(data)
+            except OSError:
+                pass
+            finally:
+                for s in (source, destination):
                     try:
-                        readable, _, _ = select.select([sock], [], [], 0)
-                        if readable:
-                            data = sock.recv(1024, socket.MSG_PEEK)
-                            if not data:
-                                player_queue.remove(sock)
-                    except:
-                        player_queue.remove(sock)
-
-                while len(player_queue) >= 2 and self.active_games < self.max_games:
-                    player1_conn = player_queue.popleft()
-                    player2_conn = player_queue.popleft()
-                    new_session_id = str(uuid.uuid4())[:8]
-                    logging.info(f"Created session {new_session_id}", extra={'sid': 'server'})
-                    game_instance = TicTacToeGame(self, new_session_id)
-                    game_instance.send_message(player1_conn, type=MessageType.START,
-                                               player=PlayerType.PLAYER_1, content=new_session_id)
-                    game_instance.send_message(player2_conn, type=MessageType.START,
-                                               player=PlayerType.PLAYER_2, content=new_session_id)
-                    game_instance.process_reset_request(player1_conn, player2_conn)
-                    p1_args = (player1_conn, player2_conn, PlayerType.PLAYER_1)
-                    p2_args = (player2_conn, player1_conn, PlayerType.PLAYER_2)
-                    executor.submit(game_instance.handle_client, *p1_args)
-                    executor.submit(game_instance.handle_client, *p2_args)
-        
+                        s.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+
+        try:
+            sock.sendall(bytes(conn.decoder.buffer))
+        except OSError:
+            pass
+        threading.Thread(target=pump, args=(sock, conn), daemon=True).start()
+        pump(conn.sock, sock)
+        conn.close()
+        sock.close()
+
+    def run_matchmaker(self):
+        """Watch the waiting room and pair players as they arrive.
+
+        Waiting sockets are registered once with the selector, so a disconnect is noticed
+        (and the player removed) as it happens instead of by rescanning the queue. A game
+        ending wakes the selector too, so queued players are paired the moment a slot frees,
+        and so does widen_rating_windows every MATCH_INTERVAL.
+        """
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ)
+        self.game_slots.on_release(self.wake_matchmaker)
+
+        while True:
+            for key, _ in self.selector.select():
+                if key.fileobj is self.wakeup_reader:
+                    self.wakeup_reader.recv(RECV_SIZE)
+                elif isinstance(key.data, ClientConnection):
+                    self.check_waiting_player(key.data)
+                else:
+                    self.check_spectator(*key.data)
+
+            while self.pending_calls:
+                callback, args = self.pending_calls.popleft()
+                callback(*args)
+
+            self.match_players()
+
+    def start(self):
+        logging.info("Starting Server...", extra={'sid': 'server'})
+        context = self.create_ssl_context()
+
+        with ThreadPoolExecutor(max_workers=self.max_games * 2) as self.game_pool, \
+            ThreadPoolExecutor(max_workers=self.handshake_workers) as self.handshake_pool, \
+            ThreadPoolExecutor(max_workers=self.version_check_workers) as self.version_pool, \
+            socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            server_socket.bind(("0.0.0.0", 52423))
+            server_socket.listen(128)
+            accept_args = (server_socket, context)
+            threading.Thread(target=self.accept_connections, args=accept_args, daemon=True).start()
+            threading.Thread(target=self.scheduler.run, daemon=True).start()
+            self.call_later(SWEEP_INTERVAL, self.sweep_sessions)
+            self.widen_rating_windows()
+            self.start_metrics()
+            self.start_recorder()
+
+            self.run_matchmaker()
+
     def shutdown(self):
         self.running = False
         sys.exit(0)
@@ -255,9 +993,77 @@ class TicTacToeServer:
         self.shutdown()
 
 
+def create_server(engine, server_options):
+    if engine == "asyncio":
+        from async_server import AsyncTicTacToeServer
+        return AsyncTicTacToeServer(**server_options)
+    return TicTacToeServer(**server_options)
+
+
 if __name__ == "__main__":
-    server = TicTacToeServer()
+    parser = argparse.ArgumentParser(description="Tic-Tac-Toe Online server")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads",
+                        help="'threads' runs a handler thread per player, 'asyncio' serves "
+                             "every connection from a single event loop")
+    parser.add_argument("--max-games", type=int, default=os.environ.get("TICTACTOE_MAX_GAMES"),
+                        help="maximum number of concurrent games per process (default: 10 for "
+                             "threads, 50000 for asyncio; also read from TICTACTOE_MAX_GAMES)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes sharing the port through SO_REUSEPORT "
+                             "(0 uses one per CPU core)")
+    parser.add_argument("--bot-after", type=float, default=os.environ.get("TICTACTOE_BOT_AFTER"),
+                        help="seconds a player waits for an opponent before being paired with a "
+                             "bot (default: never; also read from TICTACTOE_BOT_AFTER)")
+    parser.add_argument("--bot-difficulty", choices=list(DIFFICULTIES), default="Hard",
+                        help="how often bots play a perfect move (default: Hard)")
+    parser.add_argument("--metrics-port", type=int,
+                        default=os.environ.get("TICTACTOE_METRICS_PORT"),
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics (default: "
+                             "off; also read from TICTACTOE_METRICS_PORT; worker N of --workers "
+                             "uses PORT + N)")
+    parser.add_argument("--resume-grace", type=float,
+                        default=os.environ.get("TICTACTOE_RESUME_GRACE", 30.0),
+                        help="seconds a game is held for a player whose connection dropped to "
+                             "rejoin (default: 30; 0 ends the game at once; also read from "
+                             "TICTACTOE_RESUME_GRACE)")
+    parser.add_argument("--max-spectators", type=int,
+                        default=os.environ.get("TICTACTOE_MAX_SPECTATORS", 1000),
+                        help="maximum number of spectators across all games per process "
+                             "(default: 1000; also read from TICTACTOE_MAX_SPECTATORS)")
+    parser.add_argument("--max-multiplexed", type=int,
+                        default=os.environ.get("TICTACTOE_MAX_MULTIPLEXED", 100),
+                        help="maximum number of multiplexed connections per process, each "
+                             "with its own reader (default: 100; also read from "
+                             "TICTACTOE_MAX_MULTIPLEXED)")
+    parser.add_argument("--record-dir", default=os.environ.get("TICTACTOE_RECORD_DIR"),
+                        help="append a binary record of every game to log files in this "
+                             "directory (default: off; also read from TICTACTOE_RECORD_DIR)")
+    parser.add_argument("--log-format", choices=["text", "json"], default="text",
+                        help="'json' writes one JSON object per log record")
+    parser.add_argument("--log-level", choices=list(log_pipeline.LOG_LEVELS), default="info")
+    parser.add_argument("--log-sample-rate", type=float, default=2.0,
+                        help="per-session limit on high-volume log records such as moves, chat "
+                             "and handshakes, in records per second (default: 2)")
+    args = parser.parse_args()
+
+    log_pipeline.setup_logging(json_output=args.log_format == "json",
+                               sample_rate=args.log_sample_rate)
+    logging.getLogger().setLevel(log_pipeline.LOG_LEVELS[args.log_level])
+
+    server_options = {"bot_difficulty": args.bot_difficulty, "metrics_port": args.metrics_port,
+                      "resume_grace": args.resume_grace, "max_spectators": args.max_spectators,
+                      "record_dir": args.record_dir, "max_multiplexed": args.max_multiplexed}
+    if args.max_games is not None:
+        server_options["max_games"] = args.max_games
+    if args.bot_after is not None:
+        server_options["bot_after"] = args.bot_after
+
+    if args.workers != 1:
+        from supervisor import Supervisor
+        server = Supervisor(args.workers or os.cpu_count(), args.engine, server_options)
+    else:
+        server = create_server(args.engine, server_options)
 
     signal.signal(signal.SIGINT, server.signal_handler)
 
-    server.start()
\ No newline at end of file
+    server.start()
\ No newline at end of file
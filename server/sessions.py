@@ -0,0 +1,128 @@
+"""Running games by session id, so a player whose connection drops can rejoin.
+
+When a player's connection is lost (rather than closed with a LEAVE), the game
+is kept and that player is marked suspended for a grace window. Reconnecting
+with the session id and resume token from START, inside the window, puts them
+back in the same game. A periodic sweep ends games whose suspended player did
+not come back.
+
+Memory is bounded: only running games are stored, and once max_suspended
+players are being held, further drops end their game straight away.
+
+The store also keeps how many spectators each game has, so a SPECTATE without
+a session id finds the most watched game without looking at every game.
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+SWEEP_INTERVAL = 1.0
+COMPACT_SLACK = 64  # stale audience entries tolerated beyond two per watched game
+
+
+class SuspendedConnection:
+    """Stands in for a player who lost their connection; whatever is sent to them is dropped."""
+
+    def send(self, data):
+        return len(data)
+
+    def shutdown(self, how):
+        pass
+
+    def close(self):
+        pass
+
+
+class SessionStore:
+    def __init__(self, grace, max_suspended):
+        self.grace = grace
+        self.max_suspended = max_suspended
+        self.lock = threading.Lock()
+        self.games = {}
+        self.suspended = OrderedDict()  # sid -> (player, expires_at), oldest deadline first
+        self.audiences = {}  # sid -> spectators, for games that have any
+        self.popular = []  # heap of (-spectators, seq, sid); stale entries are skipped
+        self.sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.games)
+
+    def add(self, game):
+        with self.lock:
+            self.games[game.sid] = game
+
+    def remove(self, sid):
+        with self.lock:
+            self.games.pop(sid, None)
+            self.suspended.pop(sid, None)
+            self.audiences.pop(sid, None)
+
+    def suspend(self, game, player):
+        """Hold the game for a player who dropped; returns False if it has to end now instead."""
+        if self.grace <= 0:
+            return False
+        with self.lock:
+            if game.sid not in self.games or game.sid in self.suspended:
+                return False
+            if len(self.suspended) >= self.max_suspended:
+                return False
+            self.suspended[game.sid] = (player, time.monotonic() + self.grace)
+            return True
+
+    def reattach(self, sid, player, token):
+        """Claim a suspended player's seat; returns the game, or None if it is gone."""
+        with self.lock:
+            held = self.suspended.get(sid)
+            if held is None or held[0] != player or held[1] < time.monotonic():
+                return None
+            game = self.games[sid]
+            if game.resume_tokens.get(player) != token:
+                return None
+            del self.suspended[sid]
+            return game
+
+    def watched(self, sid, spectators):
+        """Note a game's new number of spectators."""
+        with self.lock:
+            if sid not in self.games:
+                return
+            if not spectators:
+                self.audiences.pop(sid, None)
+                return
+            self.audiences[sid] = spectators
+            heapq.heappush(self.popular, (-spectators, next(self.sequence), sid))
+            if len(self.popular) > 2 * len(self.audiences) + COMPACT_SLACK:
+                self.popular = [(-count, next(self.sequence), watched_sid)
+                                for watched_sid, count in self.audiences.items()]
+                heapq.heapify(self.popular)
+
+    def watchable(self, sid):
+        """The running game with this sid, or the most watched one if sid is empty.
+
+        With nobody watching anything, that is the longest running game.
+        """
+        with self.lock:
+            if sid:
+                return self.games.get(sid)
+            while self.popular:
+                spectators, _, top = self.popular[0]
+                if self.audiences.get(top) == -spectators:
+                    return self.games[top]
+                heapq.heappop(self.popular)
+            return next(iter(self.games.values()), None)
+
+    def pop_expired(self):
+        """Remove and return (game, player) for every suspension whose grace window passed."""
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            while self.suspended:
+                sid, (player, expires_at) = next(iter(self.suspended.items()))
+                if expires_at > now:
+                    break
+                del self.suspended[sid]
+                self.audiences.pop(sid, None)
+                expired.append((self.games.pop(sid), player))
+        return expired
@@ -0,0 +1,160 @@
+"""Spectators: watchers who receive a game's moves, resets and chat.
+
+Every update is encoded once by the game and offered to each watcher, and
+offering never blocks: a watcher that cannot keep up is dropped, so the two
+players never wait on anyone watching them. A late joiner is sent a SNAPSHOT
+of the board instead of the game's history.
+
+The threads engine gives each watcher a bounded queue and a writer thread
+(QueuedWatcher); under asyncio the transport's write buffer is the queue, and
+StreamConnection.send already refuses to let it grow without bound
+(StreamWatcher).
+"""
+import logging
+import queue
+import socket
+from metrics import METRICS
+
+WATCHER_QUEUE = 64  # frames a watcher may fall behind before it is dropped
+
+
+class QueuedWatcher:
+    """A watcher's connection plus the frames waiting to be written to it.
+
+    on_exit runs when the writer stops; by default it closes the connection.
+    """
+
+    def __init__(self, conn, limit=WATCHER_QUEUE):
+        self.conn = conn
+        self.on_exit = conn.close
+        self.frames = queue.Queue(maxsize=limit)
+        self.closed = False
+        self.drop_reason = "closed"
+
+    def deliver(self, data):
+        """Queue data without blocking; returns False once the watcher has been dropped."""
+        if self.closed:
+            return False
+        try:
+            self.frames.put_nowait(data)
+            return True
+        except queue.Full:
+            self.drop_reason = "slow"
+            self.close()
+            return False
+
+    def run(self):
+        """Write queued frames until closed, batching whatever piled up into one write."""
+        try:
+            while not self.closed:
+                chunks = [self.frames.get()]
+                while chunks[-1] is not None:
+                    try:
+                        chunks.append(self.frames.get_nowait())
+                    except queue.Empty:
+                        break
+                data = b"".join(chunk for chunk in chunks if chunk is not None)
+                if data:
+                    self.conn.send(data)
+                    METRICS.bytes_sent.inc(len(data))
+                if chunks[-1] is None:
+                    break
+        except OSError:
+            pass
+        finally:
+            self.closed = True
+            self.on_exit()
+
+    def close(self):
+        """Stop the writer, unblocking it if it is stuck sending to a slow reader."""
+        self.closed = True
+        try:
+            self.frames.put_nowait(None)
+        except queue.Full:
+            try:
+                self.conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class StreamWatcher:
+    """A watcher on the asyncio engine; the connection's send is already non-blocking."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.closed = False
+        self.drop_reason = "closed"
+
+    def deliver(self, data):
+        if self.closed:
+            return False
+        try:
+            self.conn.send(data)
+        except ConnectionResetError:
+            self.drop_reason = "slow"  # send aborts a connection whose buffer is full
+            self.close()
+            return False
+        except OSError:
+            self.close()
+            return False
+        METRICS.bytes_sent.inc(len(data))
+        return True
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+
+
+class SpectatorFeed:
+    """The watchers of one game. Callers hold the game's lock."""
+
+    def __init__(self, sid, on_leave, on_count=None):
+        self.sid = sid
+        self.on_leave = on_leave  # called once for every watcher that goes away
+        self.on_count = on_count  # called with (sid, watchers) whenever that changes
+        self.watchers = []
+
+    def __len__(self):
+        return len(self.watchers)
+
+    def add(self, watcher, snapshot):
+        self.watchers.append(watcher)
+        self.counted()
+        self.broadcast(snapshot, [watcher])
+
+    def counted(self):
+        if self.on_count is not None:
+            self.on_count(self.sid, len(self.watchers))
+
+    def broadcast(self, frame, watchers=None):
+        """Offer an encoded (type name, bytes) frame to every watcher, dropping slow ones."""
+        type_name, data = frame
+        delivered = 0
+        for watcher in list(self.watchers if watchers is None else watchers):
+            if watcher.deliver(data):
+                delivered += 1
+            else:
+                self.remove(watcher)
+        if delivered:
+            METRICS.messages_sent.inc(delivered, label_value=type_name)
+
+    def remove(self, watcher):
+        """Let a watcher go, counting why (drop_reason: "slow" or "closed")."""
+        if watcher not in self.watchers:
+            return
+        self.watchers.remove(watcher)
+        watcher.close()
+        METRICS.spectators_dropped.inc(label_value=watcher.drop_reason)
+        logging.debug(f"Dropped a spectator ({watcher.drop_reason})",
+                      extra={'sid': self.sid, 'event': 'watch'})
+        self.on_leave()
+        self.counted()
+
+    def close(self, final_frame):
+        """Send a last message to every watcher and let them go."""
+        self.broadcast(final_frame)
+        for watcher in self.watchers:
+            watcher.close()
+            self.on_leave()
+        self.watchers = []
+        self.counted()
@@ -0,0 +1,169 @@
+"""Multi-process server mode.
+
+The supervisor forks one worker per core. Each worker runs a complete server
+(accepting, TLS, matchmaking and games) on the same port through SO_REUSEPORT,
+so the kernel spreads incoming connections across processes and the GIL only
+limits a single worker.
+
+Workers publish their counters in a shared-memory array, which the supervisor
+aggregates. When two workers each have a single player waiting, the
+supervisor asks one of them to hand its player to the other. A TLS session
+cannot move between processes, so the donor keeps the TLS socket and relays
+its bytes through a socketpair, and the other end of that socketpair travels
+over the worker's pipe.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+from multiprocessing import reduction
+from multiprocessing.connection import wait
+
+STATS_FIELDS = 3  # active games, waiting players, lone-player flag
+STATS_INTERVAL = 0.5
+LONE_PLAYER_WAIT = 2.0
+HANDOFF_TIMEOUT = 5.0
+
+
+class WorkerLink:
+    """Worker-side end of the supervisor channel; runs on its own thread."""
+
+    def __init__(self, index, pipe, stats, supervisor_pid):
+        self.index = index
+        self.pipe = pipe
+        self.stats = stats
+        self.supervisor_pid = supervisor_pid
+        self.lone_since = None
+
+    def run(self, server):
+        while True:
+            if self.pipe.poll(STATS_INTERVAL):
+                command = self.pipe.recv()
+                if command[0] == "handoff":
+                    self.hand_off(server, command[1])
+                elif command[0] == "adopt":
+                    fd = reduction.recv_handle(self.pipe)
+                    server.call_soon(server.adopt_player, socket.socket(fileno=fd))
+            self.publish(server)
+
+    def publish(self, server):
+        waiting = len(server.player_queue)
+        if waiting != 1:
+            self.lone_since = None
+        elif self.lone_since is None:
+            self.lone_since = time.monotonic()
+        is_lone = self.lone_since is not None and \
+            time.monotonic() - self.lone_since >= LONE_PLAYER_WAIT
+        base = self.index * STATS_FIELDS
+        self.stats[base] = server.active_games
+        self.stats[base + 1] = waiting
+        self.stats[base + 2] = int(is_lone)
+
+    def hand_off(self, server, target):
+        handed_off = queue.Queue()
+        server.call_soon(server.hand_off_lone_player, handed_off.put)
+        try:
+            sock = handed_off.get(timeout=HANDOFF_TIMEOUT)
+        except queue.Empty:
+            return
+        if sock is None:
+            return
+        self.lone_since = None
+        self.pipe.send(("handoff", target))
+        reduction.send_handle(self.pipe, sock.fileno(), self.supervisor_pid)
+        sock.close()
+
+
+def run_worker(index, engine, server_options, pipe, stats, supervisor_pid):
+    from server import create_server
+    import log_pipeline
+
+    # The log listener thread does not survive the fork; start a fresh one.
+    if log_pipeline.active_options is not None:
+        log_pipeline.setup_logging(**log_pipeline.active_options)
+
+    server = create_server(engine, server_options)
+    server.reuse_port = True
+    if server.metrics_port is not None:
+        server.metrics_port += index
+    signal.signal(signal.SIGINT, server.signal_handler)
+    link = WorkerLink(index, pipe, stats, supervisor_pid)
+    threading.Thread(target=link.run, args=(server,), daemon=True).start()
+    server.start()
+
+
+class Supervisor:
+    def __init__(self, workers, engine, server_options):
+        self.workers = workers
+        self.engine = engine
+        self.server_options = server_options
+        self.stats = multiprocessing.Array("i", workers * STATS_FIELDS, lock=False)
+        self.pipes = []
+        self.processes = []
+        self.last_totals = None
+
+    def start(self):
+        logging.info(f"Starting {self.workers} worker processes...", extra={'sid': 'server'})
+        for index in range(self.workers):
+            parent_pipe, child_pipe = multiprocessing.Pipe()
+            args = (index, self.engine, self.server_options, child_pipe, self.stats, os.getpid())
+            process = multiprocessing.Process(target=run_worker, args=args, daemon=True)
+            process.start()
+            self.pipes.append(parent_pipe)
+            self.processes.append(process)
+
+        while True:
+            live_pipes = [pipe for pipe in self.pipes if pipe is not None]
+            for pipe in wait(live_pipes, timeout=STATS_INTERVAL):
+                try:
+                    command = pipe.recv()
+                except EOFError:
+                    index = self.pipes.index(pipe)
+                    self.pipes[index] = None
+                    logging.error(f"Worker {index} exited", extra={'sid': 'server'})
+                    continue
+                if command[0] == "handoff":
+                    self.forward_player(pipe, command[1])
+            self.pair_lone_players()
+            self.log_totals()
+
+    def forward_player(self, donor_pipe, target):
+        fd = reduction.recv_handle(donor_pipe)
+        try:
+            if self.pipes[target] is None:
+                return
+            self.pipes[target].send(("adopt",))
+            reduction.send_handle(self.pipes[target], fd, self.processes[target].pid)
+        finally:
+            os.close(fd)
+
+    def pair_lone_players(self):
+        lone = [index for index in range(self.workers)
+                if self.pipes[index] is not None and self.stats[index * STATS_FIELDS + 2]]
+        for adopter, donor in zip(lone[::2], lone[1::2]):
+            logging.info(f"Moving lone player from worker {donor} to worker {adopter}",
+                         extra={'sid': 'server'})
+            self.stats[donor * STATS_FIELDS + 2] = 0
+            self.stats[adopter * STATS_FIELDS + 2] = 0
+            self.pipes[donor].send(("handoff", adopter))
+
+    def log_totals(self):
+        active = sum(self.stats[index * STATS_FIELDS] for index in range(self.workers))
+        waiting = sum(self.stats[index * STATS_FIELDS + 1] for index in range(self.workers))
+        if (active, waiting) != self.last_totals:
+            self.last_totals = (active, waiting)
+            logging.info(f"{active} active games, {waiting} waiting players across "
+                         f"{self.workers} workers", extra={'sid': 'server'})
+
+    def signal_handler(self, sig, frame):
+        print()
+        logging.info("Gracefully shutting down...", extra={'sid': 'server'})
+        for process in self.processes:
+            process.terminate()
+        os.system('stty sane')
+        sys.exit(0)